@@ -15,12 +15,12 @@ from librar.log import log, init as log_init
 from librar.policy import this_policy as policy
 
 
-def add_domain_action(dom_db, now, when, action):
+def add_domain_action(new_actions, dom_db, now, when, action):
     if when >= now:
-        sql.sql_insert("actions", {"domain_id": dom_db["domain_id"], "execute_dt": when, "action": action})
+        new_actions.append({"domain_id": dom_db["domain_id"], "execute_dt": when, "action": action})
 
 
-def add_order_reminders(dom_db, now, reminder_sched, reminder_type):
+def add_order_reminders(new_actions, dom_db, now, reminder_sched, reminder_type):
     ok, order_db = sql.sql_select_one("orders", {"domain_id": dom_db["domain_id"]})
     if not ok or len(order_db) <= 0:
         return
@@ -33,42 +33,46 @@ def add_order_reminders(dom_db, now, reminder_sched, reminder_type):
         raise ValueError(f"Reminder schedule for {reminder_type} has invalid type")
 
     for days in sched[:-1]:
-        add_domain_action(dom_db, now, misc.date_add(order_db["created_dt"], hours=float(days) * 24), reminder_type)
-    add_domain_action(dom_db, now, misc.date_add(order_db["created_dt"], hours=float(sched[-1]) * 24), "order/cancel")
+        add_domain_action(new_actions, dom_db, now, misc.date_add(order_db["created_dt"], hours=float(days) * 24),
+                          reminder_type)
+    add_domain_action(new_actions, dom_db, now, misc.date_add(order_db["created_dt"], hours=float(sched[-1]) * 24),
+                      "order/cancel")
 
 
-def domain_actions_live(dom_db, now):
+def domain_actions_live(new_actions, dom_db, now):
     if dom_db["auto_renew"]:
-        add_domain_action(dom_db, now,
+        add_domain_action(new_actions, dom_db, now,
                           misc.date_add(dom_db["expiry_dt"], days=-1 * float(policy.policy("auto_renew_before"))),
                           "dom/auto-renew")
     else:
         if (reminders_at := policy.policy("renewal_reminders")) is not None:
             for days in reminders_at.split(","):
-                add_domain_action(dom_db, now, misc.date_add(dom_db["expiry_dt"], days=-1 * float(days)),
+                add_domain_action(new_actions, dom_db, now, misc.date_add(dom_db["expiry_dt"], days=-1 * float(days)),
                                   "dom/reminder")
 
-    add_domain_action(dom_db, now, dom_db["expiry_dt"], "dom/expired")
+    add_domain_action(new_actions, dom_db, now, dom_db["expiry_dt"], "dom/expired")
 
     this_reg = registry.tld_lib.reg_record_for_domain(dom_db["name"])
     if this_reg is not None:
-        add_domain_action(dom_db, now, misc.date_add(dom_db["expiry_dt"],
-                                                     days=float(this_reg["expire_recover_limit"])), "dom/delete")
+        add_domain_action(new_actions, dom_db, now,
+                          misc.date_add(dom_db["expiry_dt"], days=float(this_reg["expire_recover_limit"])),
+                          "dom/delete")
 
-    add_order_reminders(dom_db, now, this_reg["renew_order_remind_cancel"], "order/reminder")
+    add_order_reminders(new_actions, dom_db, now, this_reg["renew_order_remind_cancel"], "order/reminder")
 
 
-def domain_actions_pending_order(dom_db, now):
+def domain_actions_pending_order(new_actions, dom_db, now):
     if (this_reg := registry.tld_lib.reg_record_for_domain(dom_db["name"])) is None:
         return
-    add_order_reminders(dom_db, now, this_reg["new_order_remind_cancel"], "order/reminder")
+    add_order_reminders(new_actions, dom_db, now, this_reg["new_order_remind_cancel"], "order/reminder")
 
 
 def recreate(dom_db, who_did_it="sales"):
+    expiry_date = misc.date_str(dom_db["expiry_dt"]).split()[0]
     mysql.event_log(
         {
             "event_type": "actions/recreate",
-            "notes": f"Recreate domain actions for '{dom_db['name']}', Exp {dom_db['expiry_dt'].split()[0]}",
+            "notes": f"Recreate domain actions for '{dom_db['name']}', Exp {expiry_date}",
             "domain_id": dom_db["domain_id"],
             "user_id": dom_db["user_id"],
             "who_did_it": who_did_it,
@@ -77,9 +81,13 @@ def recreate(dom_db, who_did_it="sales"):
 
     sql.sql_delete("actions", {"domain_id": dom_db["domain_id"]})
 
-    now = misc.now()
+    now = misc.now_like(dom_db["expiry_dt"])
     if dom_db["status_id"] in action_fns:
-        return action_fns[dom_db["status_id"]](dom_db, now)
+        new_actions = []
+        ret = action_fns[dom_db["status_id"]](new_actions, dom_db, now)
+        if len(new_actions) > 0:
+            sql.sql_insert_many("actions", new_actions)
+        return ret
 
     log(f"WARNINNG: No domain action recreate for domain status {dom_db['status_id']}")
     return True
@@ -94,7 +102,7 @@ action_fns = {
 
 def main():
     log_init(with_debug=True)
-    sql.connect("engine")
+    sql.connect("engine", native_dates=True)
     registry.start_up()
 
     ok, dom_db = sql.sql_select_one("domains", {"name": sys.argv[1]})
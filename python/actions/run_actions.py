@@ -8,7 +8,7 @@ import argparse
 
 from librar import static, misc, registry, pdns, mysql
 from librar.mysql import sql_server as sql
-from librar.log import log, debug, init as log_init
+from librar.log import log, debug, context as log_context, init as log_init
 from mailer import spool_email
 from backend import backend_creator
 
@@ -103,7 +103,11 @@ def runner():
     if not ok or not act_data or len(act_data) < 1:
         return False
 
-    act_db = act_data[0]
+    with log_context(job=f"ACT-{act_data[0]['action_id']}"):
+        return run_action(act_data[0])
+
+
+def run_action(act_db):
     if act_db["action"] not in action_exec:
         log(f"ERROR: Domain action '{act_db['action']}' for DOM-{act_db['domain_id']} - action not found")
         return delete_action(act_db)
@@ -128,7 +132,7 @@ def main():
     args = parser.parse_args()
     log_init(with_debug=(args.debug or args.action or args.domain))
 
-    sql.connect("engine")
+    sql.connect("engine", native_dates=True)
     pdns.start_up()
     registry.start_up()
 
@@ -142,7 +146,7 @@ def main():
             debug(f"ERROR: action '{args.action}' not possible")
             sys.exit(1)
 
-        act_db = {"domain_id": dom_db["domain_id"], "execute_dt": misc.now(), "action": args.action}
+        act_db = {"domain_id": dom_db["domain_id"], "execute_dt": misc.now(native=True), "action": args.action}
         print(">>>> RUNNING", args.action, "on", dom_db["name"])
         print(">>>> ACTION", action_exec[args.action](act_db, dom_db))
         sys.exit(0)
@@ -22,12 +22,15 @@ class Refund:
         if not ok:
             return False, reply
 
-        ok, reply = self.create_refund_db()
-        if not ok:
-            return False, reply
-
-        self.log_event()
-        return self.save_refund()
+        with sql.transaction():
+            ok, reply = self.create_refund_db()
+            if ok:
+                self.log_event()
+                ok, reply = self.save_refund()
+            if not ok:
+                sql.fail_transaction()
+
+        return ok, reply
 
     def load_data(self, sales_item_id):
         ok, self.sale_db = sql.sql_select_one("sales", {"sales_item_id": sales_item_id})
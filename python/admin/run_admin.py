@@ -4,10 +4,14 @@
 """ Admin webui """
 
 from datetime import datetime
+import os
+import json
+import itertools
+import threading
 import subprocess
 import flask
 
-from librar.log import log, init as log_init
+from librar.log import log, start_context, end_context, request_id, init as log_init
 from librar.policy import this_policy as policy
 from librar.mysql import sql_server as sql
 from librar import registry, pdns, accounts, domobj, passwd, validate, common_ui, misc
@@ -383,16 +387,39 @@ def check_supplied_modifiers(sent, allowed):
 
 application = flask.Flask("MySQL-Rest/API")
 log_init("logging_admin")
-sql.connect("admin")
-sql.make_schema()
-set_amended_and_created()
-registry.start_up()
-pdns.start_up()
 
 site_currency = policy.policy("currency")
 if not validate.valid_currency(site_currency):
     raise ValueError("ERROR: Main policy.currency is not set up correctly")
 
+WORKER_PID = None
+worker_lock = threading.Lock()
+
+
+@application.before_request
+def start_worker():
+    """ open the DB & HTTP sessions in this process, after any fork, so `gunicorn --preload` never shares them
+        the gunicorn `post_fork` hook runs this, so a worker is ready before its first request
+        the DB connection used is given back to the pool, as the thread running `post_fork` serves no requests """
+    global WORKER_PID
+    if WORKER_PID == os.getpid():
+        return
+    with worker_lock:
+        if WORKER_PID == os.getpid():
+            return
+        sql.connect("admin")
+        sql.make_schema()
+        set_amended_and_created()
+        registry.start_up()
+        pdns.start_up()
+        sql.release()
+        WORKER_PID = os.getpid()
+
+
+@application.before_request
+def start_log_context():
+    start_context(request=request_id(flask.request.headers.get("X-Request-ID")))
+
 
 @application.before_request
 def before_request():
@@ -400,6 +427,12 @@ def before_request():
         libback.start_ups()
 
 
+@application.teardown_request
+def teardown_request(__):
+    sql.release()
+    end_context()
+
+
 @application.route("/adm/v1", methods=['GET'])
 def hello():
     """ respond with a `hello` to confirm working """
@@ -464,6 +497,39 @@ def get_sql_rows(query, start):
     return reply
 
 
+def stream_sql_rows(table, query, start):
+    """ run the {query} & stream the rows out as they are read, instead of loading them all first
+        the rows are read after `teardown_request`, so the connection is kept until the response is closed """
+    ok, batches = sql.run_select_iter(query)
+    if not ok:
+        return response(200, {})
+    if (first_rows := next(batches, None)) is None:
+        return response(200, ({}, 200))  # what `get_sql_rows` gives for no rows
+
+    held = sql.detach()
+
+    def generate():
+        rowid = start + 1
+        sep = ""
+        yield "{" + json.dumps(table) + ":["
+        for rows in itertools.chain([first_rows], batches):
+            for row in rows:
+                row[":rowid:"] = rowid
+                rowid = rowid + 1
+            prepare_row_data(rows, table)
+            yield sep + ",".join([json.dumps(row) for row in rows])
+            sep = ","
+        yield "]}"
+
+    def response_closed():
+        batches.close()
+        sql.checkin_detached(held)
+
+    resp = flask.Response(flask.stream_with_context(generate()), mimetype="application/json")
+    resp.call_on_close(response_closed)
+    return resp
+
+
 def process_one_set(set_clause, table):
     """ turn {set_clause} object into a sql insert statement """
     ret = []
@@ -669,6 +735,9 @@ def get_table_row(table):
     check_supplied_modifiers(sent, ["where", "limit", "skip", "by", "order", "join", "join-basic"])
 
     start, query = build_sql(table, sent, f"select {table}.* from {table} ")
+    if "by" not in sent and "join" not in sent:
+        return stream_sql_rows(table, query, start)
+
     sql_rows = get_sql_rows(query, start)
 
     if not isinstance(sql_rows, list):
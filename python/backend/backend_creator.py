@@ -8,8 +8,8 @@ from librar import misc
 from librar.mysql import sql_server as sql
 
 
-def make_job(job_type, dom_db, num_years=None, authcode=None):
-    backend_db = {
+def job_record(job_type, dom_db, num_years=None, authcode=None):
+    return {
         "domain_id": dom_db["domain_id"],
         "user_id": dom_db["user_id"],
         "num_years": num_years,
@@ -21,6 +21,27 @@ def make_job(job_type, dom_db, num_years=None, authcode=None):
         "amended_dt": None
     }
 
-    ok = sql.sql_insert("backend", backend_db)
+
+def make_job(job_type, dom_db, num_years=None, authcode=None):
+    ok = sql.sql_insert("backend", job_record(job_type, dom_db, num_years, authcode))
+    sigprocs.signal_service("backend")
+    return ok
+
+
+def make_jobs(backend_dbs):
+    """ insert a list of `job_record`s in one go """
+    if len(backend_dbs) <= 0:
+        return True
+    ok, __, __ = sql.sql_insert_many("backend", backend_dbs)
     sigprocs.signal_service("backend")
     return ok
+
+
+def insert_job(job_type, dom_db, num_years=None, authcode=None):
+    """ add the job without waking the backend, e.g. in a `transaction`, call `signal_backend` after the commit """
+    ok, __ = sql.sql_insert("backend", job_record(job_type, dom_db, num_years, authcode))
+    return ok is not None and ok is not False and ok > 0
+
+
+def signal_backend():
+    sigprocs.signal_service("backend")
@@ -2,6 +2,10 @@
 # (c) Copyright 2019-2022, James Stevens ... see LICENSE for details
 # Alternative license arrangements possible, contact me for more information
 
+import importlib
+
+from backend import dom_plugins
+
 backend_plugins = {}
 
 
@@ -11,8 +15,15 @@ def add_plugin(name, funcs):
     return True
 
 
+def plugin(name):
+    """ handlers for plugin {name}, its module is only imported the first time it is needed """
+    if name not in backend_plugins and name in dom_plugins.__all__:
+        importlib.import_module(f"{dom_plugins.__name__}.{name}")
+    return backend_plugins.get(name)
+
+
 def run(plugin_name, func_name):
     """ return the function named {func_name} in the set of handlers for {plugin_name} """
-    if plugin_name not in backend_plugins or func_name not in backend_plugins[plugin_name]:
+    if (funcs := plugin(plugin_name)) is None or func_name not in funcs:
         return None
-    return backend_plugins[plugin_name][func_name]
+    return funcs[func_name]
@@ -3,6 +3,10 @@
 # Alternative license arrangements possible, contact me for more information
 """ bacnend call-backs for running as registry locally """
 
+import re
+import time
+import threading
+
 from librar.log import log, init as log_init
 
 from librar.mysql import sql_server as sql
@@ -175,21 +179,123 @@ def domain_info(bke_job, dom):
     return dom.dom_db
 
 
-def get_class_from_name(name):
-    """ support for domain:class, premium pricing. Return class for {name} """
-    ok, class_db = sql.sql_select_one("class_by_name", {"name": name}, "class")
-    if ok and class_db and len(class_db) > 0:
-        return class_db["class"].lower()
+CLASS_TABLES = ["class_by_name", "class_by_regexp"]
+CLASS_LAST_CHANGE_SQL = (
+    "select (select concat(count(*),'/',ifnull(max(amended_dt),'')) from class_by_name) 'names'," +
+    "(select concat(count(*),'/',ifnull(max(amended_dt),'')) from class_by_regexp) 'regexps'")
+
+# MySQL regexp items Python's `re` doesn't have
+MYSQL_REGEXP_ITEMS = {
+    "[[:<:]]": r"\b",
+    "[[:>:]]": r"\b",
+    "[:digit:]": "0-9",
+    "[:alpha:]": "a-z",
+    "[:alnum:]": "a-z0-9",
+    "[:lower:]": "a-z",
+    "[:upper:]": "a-z",
+    "[:xdigit:]": "0-9a-f",
+    "[:space:]": r"\s",
+    "[:punct:]": r"!-/:-@\[-`{-~"
+}
+MYSQL_REGEXP_ITEMS_RE = re.compile("|".join(re.escape(item) for item in MYSQL_REGEXP_ITEMS))
+HAS_BACKREF = re.compile(r"\\[1-9]|\(\?P=")
+
+
+def compile_class_regexps(rows):
+    """ {rows} of one zone, in priority order, as one alternation where the first to match anywhere wins
+        each is a look-ahead followed by an empty named group, `match.lastgroup` tells us which matched """
+    patterns = []
+    for row in rows:
+        mysql_regexp = MYSQL_REGEXP_ITEMS_RE.sub(lambda item: MYSQL_REGEXP_ITEMS[item.group(0)], row["name_regexp"])
+        try:
+            re.compile(mysql_regexp, re.IGNORECASE)
+        except re.error as exc:
+            log(f"ERROR: class_by_regexp '{row['name_regexp']}' for '{row['zone']}' is not valid: {exc}")
+            continue
+        patterns.append([mysql_regexp, row["class"].lower()])
+
+    if patterns and not any(HAS_BACKREF.search(mysql_regexp) for mysql_regexp, __ in patterns):
+        combined = "|".join(f"(?=[\\s\\S]*?(?:{mysql_regexp}))(?P<c{idx}>)"
+                            for idx, (mysql_regexp, __) in enumerate(patterns))
+        try:
+            return re.compile(combined, re.IGNORECASE), [cls for __, cls in patterns]
+        except re.error:
+            pass
+
+    return None, [(re.compile(mysql_regexp, re.IGNORECASE), cls) for mysql_regexp, cls in patterns]
+
+
+class ClassIndex:
+    """ `class_by_name` & `class_by_regexp` in memory, reloaded when PyRar writes to either table
+        or, for changes made directly in the database, when they are seen every `class_recheck_secs` """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_name = {}
+        self.by_zone = {}
+        self.generations = None
+        self.last_change = None
+        self.checked_at = 0
+
+    def check(self):
+        generations = [sql.table_generation(table) for table in CLASS_TABLES]
+        if generations == self.generations and time.time() - self.checked_at < policy.policy("class_recheck_secs"):
+            return
+        with self.lock:
+            if generations == self.generations and time.time() - self.checked_at < policy.policy("class_recheck_secs"):
+                return
+            self.checked_at = time.time()
+            ok, reply = sql.run_select(CLASS_LAST_CHANGE_SQL)
+            if not ok or len(reply) != 1:
+                return
+            if generations == self.generations and reply[0] == self.last_change:
+                return
+            if self.load():
+                self.generations = generations
+                self.last_change = reply[0]
+
+    def load(self):
+        ok_names, names = sql.run_select("select name,class from class_by_name")
+        ok_regexps, regexps = sql.run_select(
+            "select zone,name_regexp,class from class_by_regexp order by prioiry,name_regexp_id")
+        if not ok_names or not ok_regexps:
+            log("ERROR: Failed to load the domain class tables")
+            return False
+
+        by_zone_rows = {}
+        for row in regexps:
+            by_zone_rows.setdefault(row["zone"].lower(), []).append(row)
+
+        self.by_name = {row["name"].lower(): row["class"].lower() for row in names}
+        self.by_zone = {zone: compile_class_regexps(rows) for zone, rows in by_zone_rows.items()}
+        return True
+
+    def class_of_name(self, name):
+        self.check()
+        name = name.lower()
+        if (cls := self.by_name.get(name)) is not None:
+            return cls
+
+        if (idx := name.find(".")) < 0 or (zone_regexps := self.by_zone.get(name[idx + 1:])) is None:
+            return "standard"
 
-    if (idx := name.find(".")) < 0:
+        combined, classes = zone_regexps
+        if combined is not None:
+            if (match := combined.match(name[:idx])) is not None:
+                return classes[int(match.lastgroup[1:])]
+            return "standard"
+
+        for regexp, cls in classes:
+            if regexp.search(name[:idx]):
+                return cls
         return "standard"
 
-    where = f"(unhex('{misc.ashex(name[:idx])}') regexp name_regexp) and zone = unhex('{misc.ashex(name[idx+1:])}')"
-    ok, class_db = sql.sql_select("class_by_regexp", where, "class", limit=1, order_by="priority")
-    if ok and class_db and len(class_db) > 0:
-        return class_db["class"].lower()
 
-    return "standard"
+class_index = ClassIndex()
+
+
+def get_class_from_name(name):
+    """ support for domain:class, premium pricing. Return class for {name} """
+    return class_index.class_of_name(name)
 
 
 def local_domain_prices(domlist, num_years=1, qry_type=None):
@@ -12,7 +12,7 @@ from librar import registry
 from librar import pdns
 from librar import domobj
 from librar import misc
-from librar.log import log, init as log_init
+from librar.log import log, context as log_context, init as log_init
 from librar.policy import this_policy as policy
 from librar import sigprocs
 from actions import make_actions
@@ -110,7 +110,8 @@ def run_server():
                  f" and failures < {policy.policy('backend_retry_attempts')} order by backend_id limit 1")
         ret, bke_job = sql.run_select(query)
         if ret and len(bke_job) > 0:
-            run_backend_item(bke_job[0])
+            with log_context(job=f"BKE-{bke_job[0]['backend_id']}"):
+                run_backend_item(bke_job[0])
         else:
             signal_mtime = sigprocs.signal_wait("backend", signal_mtime)
             if registry.tld_lib.check_for_new_files():
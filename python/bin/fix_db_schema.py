@@ -134,3 +134,8 @@ for table, table_data in save_schema.items():
                 unique = f"index {index}"
             query = f"alter table {table} add {unique} ({','.join(idx_data['columns'])})"
             run_query(query)
+
+if not args.debug:
+    for table in save_schema:
+        if table != ":more:":
+            sql.table_changed(table)
@@ -0,0 +1,47 @@
+#! /usr/bin/python3
+# (c) Copyright 2019-2023, James Stevens ... see LICENSE for details
+# Alternative license arrangements possible, contact me for more information
+""" show the SQL statements that take the most time, per daemon """
+
+import json
+import time
+import argparse
+
+from librar import sqlstats
+
+parser = argparse.ArgumentParser(description='Show top SQL statements by time')
+parser.add_argument("-d", '--daemon', help="Only this daemon, e.g. webui, admin, backend, actions, spooler, cardproc")
+parser.add_argument("-n", '--top', type=int, default=10, help="Number of statements to show per daemon")
+parser.add_argument("-s",
+                    '--sort-by',
+                    default="total_secs",
+                    choices=["total_secs", "count", "max_secs", "errors", "rows"])
+parser.add_argument("-a", '--max-age', type=int, help="Ignore reports older than this many seconds")
+parser.add_argument("-j", '--json', action="store_true", help="Output as JSON")
+args = parser.parse_args()
+
+reports = sqlstats.load_reports(args.daemon)
+if args.max_age:
+    reports = [report for report in reports if report["when"] >= time.time() - args.max_age]
+
+merged = sqlstats.merge_reports(reports)
+counters = sqlstats.merge_counters(reports)
+top_n = {
+    daemon: sorted(stats.values(), key=lambda row: row[args.sort_by], reverse=True)[:args.top]
+    for daemon, stats in merged.items()
+}
+
+if args.json:
+    print(json.dumps(top_n, indent=3))
+else:
+    for daemon, rows in top_n.items():
+        print(f"==== {daemon}")
+        for row in rows:
+            avg_ms = row["total_secs"] * 1000 / row["count"]
+            print(
+                f"{row['total_secs']:10.3f}s {row['count']:8} runs {avg_ms:9.2f}ms avg {row['max_secs']:8.3f}s max " +
+                f"{row['errors']:5} errs {row['rows']:9} rows  {row['sql']}")
+            print(" " * 11 + " ".join([f"{name}:{num}" for name, num in zip(sqlstats.HIST_NAMES, row["hist"]) if num]))
+        for name, these_counters in counters.get(daemon, {}).items():
+            print(f"{name}: {json.dumps(these_counters)}")
+        print("")
@@ -40,17 +40,18 @@ def verbose_output(this_row):
 sql.connect(args.user)
 
 for query in args.sql:
-    ok, reply = sql.run_select(query)
+    ok, batches = sql.run_select_iter(query)
     FIRST_ROW = sys.stdout.isatty()
     if not ok:
         break
-    for row in reply:
-        if args.output_long:
-            verbose_output(row)
-        else:
-            if FIRST_ROW:
-                print("|".join([str(i) for i in row]))
-                FIRST_ROW = False
-            print("|".join([str(row[i]) for i in row]))
+    for reply in batches:
+        for row in reply:
+            if args.output_long:
+                verbose_output(row)
+            else:
+                if FIRST_ROW:
+                    print("|".join([str(i) for i in row]))
+                    FIRST_ROW = False
+                print("|".join([str(row[i]) for i in row]))
 
 sql.sql_close()
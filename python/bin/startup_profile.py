@@ -0,0 +1,272 @@
+#! /usr/bin/python3
+# (c) Copyright 2019-2023, James Stevens ... see LICENSE for details
+# Alternative license arrangements possible, contact me for more information
+""" boot each daemon's entry point & report where its start-up time goes, as JSON, so reports can be compared """
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import importlib
+import functools
+import subprocess
+
+from librar import static
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMED_FUNCS = [
+    "librar.mysql:MariaDB.connect", "librar.mysql:MariaDB.make_schema", "librar.registry:start_up",
+    "librar.pdns:start_up", "backend.libback:start_ups", "payments.libpay:startup"
+]
+
+ENTRY_POINTS = {
+    "webui": {
+        "module": "webui.run_webui",
+        "timed": TIMED_FUNCS,
+        "steps": [("webui.run_webui:start_worker", [])]
+    },
+    "admin": {
+        "module": "admin.run_admin",
+        "timed": TIMED_FUNCS,
+        "steps": [("admin.run_admin:start_worker", [])]
+    },
+    "epprest": {
+        "module": "epprest.run_eppapi",
+        "timed": [],
+        "steps": []
+    },
+    "backend": {
+        "module": "backend.run_backend",
+        "timed": TIMED_FUNCS,
+        "steps": [("backend.run_backend:start_up", [True])]
+    },
+    "cardproc": {
+        "module": "cardproc.run_cardproc",
+        "timed": TIMED_FUNCS,
+        "steps": [("librar.mysql:sql_server.connect", ["engine"]), ("librar.registry:start_up", [])]
+    },
+    "spooler": {
+        "module": "mailer.run_spooler",
+        "timed": TIMED_FUNCS,
+        "steps": [("librar.mysql:sql_server.connect", ["engine", True]), ("librar.registry:start_up", [])]
+    }
+}
+
+start_up_secs = {}
+
+
+def find_object(path):
+    """ {path} is `module:attr.attr`, returns the object that attr is on, its name & the object """
+    module_name, attrs = path.split(":")
+    parent = importlib.import_module(module_name)
+    attr_names = attrs.split(".")
+    for attr in attr_names[:-1]:
+        parent = getattr(parent, attr)
+    return parent, attr_names[-1], getattr(parent, attr_names[-1])
+
+
+def timed(label, func):
+    @functools.wraps(func)
+    def timer(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            this_time = start_up_secs.setdefault(label, {"secs": 0, "calls": 0})
+            this_time["secs"] += time.perf_counter() - started
+            this_time["calls"] += 1
+
+    return timer
+
+
+def time_plugin_start_ups(dom_handler):
+    """ wrap each domain plugin's `start_up`, those already loaded & those that register themselves later """
+    for name, funcs in dom_handler.backend_plugins.items():
+        if "start_up" in funcs:
+            funcs["start_up"] = timed(f"{name}:start_up_check", funcs["start_up"])
+
+    add_plugin = dom_handler.add_plugin
+
+    def add_timed_plugin(name, funcs):
+        if "start_up" in funcs:
+            funcs["start_up"] = timed(f"{name}:start_up_check", funcs["start_up"])
+        return add_plugin(name, funcs)
+
+    dom_handler.add_plugin = add_timed_plugin
+
+
+def time_loaded_funcs(timed_funcs):
+    """ wrap the functions in {timed_funcs} whose modules the entry point has imported
+        others are left alone, importing them here would measure us, not the daemon """
+    for path in timed_funcs:
+        if path.split(":")[0] in sys.modules:
+            parent, attr, func = find_object(path)
+            setattr(parent, attr, timed(path, func))
+    if timed_funcs and "backend.dom_handler" in sys.modules:
+        time_plugin_start_ups(sys.modules["backend.dom_handler"])
+
+
+def run_child(name):
+    """ runs in the process being measured, prints its results as JSON """
+    entry = ENTRY_POINTS[name.split(":")[0]]
+    report = {"ok": True, "error": None}
+    started = time.perf_counter()
+    try:
+        importlib.import_module(entry["module"])
+        report["import_secs"] = time.perf_counter() - started
+        time_loaded_funcs(entry["timed"])
+        for path, args in entry["steps"]:
+            __, __, func = find_object(path)
+            step_started = time.perf_counter()
+            func(*args)
+            start_up_secs[f"step {path}"] = {"secs": time.perf_counter() - step_started, "calls": 1}
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        report["ok"] = False
+        report["error"] = f"{type(exc).__name__}: {exc}"
+
+    report["total_secs"] = time.perf_counter() - started
+    report["start_up"] = start_up_secs
+    report["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps(report))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def parse_import_times(lines, top_n):
+    """ per module times from `python -X importtime`, the {top_n} slowest by their own time """
+    modules = []
+    for line in lines:
+        if line[:12] != "import time:" or line.find("[us]") >= 0:
+            continue
+        parts = line[12:].split("|")
+        if len(parts) != 3:
+            continue
+        modules.append({
+            "module": parts[2].strip(),
+            "self_ms": int(parts[0]) / 1000,
+            "cumulative_ms": int(parts[1]) / 1000
+        })
+
+    by_package = {}
+    for module in modules:
+        package = module["module"].split(".")[0]
+        by_package[package] = by_package.get(package, 0) + module["self_ms"]
+
+    modules.sort(key=lambda module: module["self_ms"], reverse=True)
+    return {
+        "module_count": len(modules),
+        "import_ms": sum(module["self_ms"] for module in modules),
+        "packages_ms": dict(sorted(by_package.items(), key=lambda item: item[1], reverse=True)),
+        "slowest_modules": modules[:top_n]
+    }
+
+
+def profile_entry_point(name, top_n):
+    """ boot entry point {name} in a new python, with `-X importtime` on """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = PYTHON_DIR + (":" + env["PYTHONPATH"] if "PYTHONPATH" in env else "")
+    if name.find(":") > 0:
+        env["PYRAR_REGISTRY"] = name.split(":")[1]
+
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime",
+                           os.path.abspath(__file__), "--child", name],
+                          cwd=PYTHON_DIR,
+                          env=env,
+                          capture_output=True,
+                          text=True,
+                          check=False)
+    wall_secs = time.perf_counter() - started
+
+    report = None
+    for line in proc.stdout.split("\n"):
+        if line[:1] == "{":
+            report = json.loads(line)
+    if report is None:
+        report = {"ok": False, "error": f"Child exited with {proc.returncode}, no report"}
+    report["wall_secs"] = wall_secs
+    report.update(parse_import_times(proc.stderr.split("\n"), top_n))
+    return report
+
+
+def epp_registries():
+    try:
+        with open(static.REGISTRY_FILE, "r", encoding="UTF-8") as fd:
+            regs = json.load(fd)
+    except (ValueError, IOError):
+        return []
+    return [name for name, reg_data in regs.items() if reg_data.get("type") == "epp"]
+
+
+def show_report(report, old_report):
+    for name, this_entry in report["entry_points"].items():
+        old_entry = old_report["entry_points"].get(name) if old_report is not None else None
+        status = "OK" if this_entry["ok"] else f"FAILED {this_entry['error']}"
+
+        def diff(item, this_entry=this_entry, old_entry=old_entry):
+            if old_entry is None or item not in old_entry or item not in this_entry:
+                return ""
+            return f" ({this_entry[item] - old_entry[item]:+.3f})"
+
+        print(f"==== {name}: {status}")
+        print(
+            f"   wall {this_entry['wall_secs']:.3f}s{diff('wall_secs')}, " +
+            f"imports {this_entry['import_ms']:.1f}ms{diff('import_ms')} over {this_entry['module_count']} modules, " +
+            f"peak RSS {this_entry.get('peak_rss_kb', 0)}KB{diff('peak_rss_kb')}")
+        for label, this_time in this_entry.get("start_up", {}).items():
+            print(f"   {this_time['secs']:8.3f}s {this_time['calls']:3} calls  {label}")
+        for module in this_entry["slowest_modules"]:
+            print(f"   {module['self_ms']:8.1f}ms self {module['cumulative_ms']:8.1f}ms total  {module['module']}")
+        print("")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile the start-up of each PyRar daemon')
+    parser.add_argument("-e", '--entry', action="append", help=f"Only this entry point, from {list(ENTRY_POINTS)}")
+    parser.add_argument("-r", '--registry', action="append", help="Profile `epprest` for this registry")
+    parser.add_argument("-n", '--top', type=int, default=10, help="Number of slowest modules to list")
+    parser.add_argument("-o", '--output', help="Save the JSON report to this file")
+    parser.add_argument("-c", '--compare', help="Show the differences from this saved JSON report")
+    parser.add_argument("-j", '--json', action="store_true", help="Output as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child)
+
+    entries = args.entry if args.entry else list(ENTRY_POINTS)
+    names = []
+    for entry in entries:
+        if entry not in ENTRY_POINTS:
+            print(f"ERROR: Entry point '{entry}' not known")
+            sys.exit(1)
+        if entry == "epprest":
+            names += [f"epprest:{reg}" for reg in (args.registry if args.registry else epp_registries())]
+        else:
+            names.append(entry)
+
+    report = {"when": int(time.time()), "python": sys.version.split()[0], "entry_points": {}}
+    for name in names:
+        report["entry_points"][name] = profile_entry_point(name, args.top)
+
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as fd:
+            json.dump(report, fd, indent=3)
+
+    if args.json:
+        print(json.dumps(report, indent=3))
+        return None
+
+    old_report = None
+    if args.compare:
+        with open(args.compare, "r", encoding="UTF-8") as fd:
+            old_report = json.load(fd)
+    show_report(report, old_report)
+    return None
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@
 import argparse
 
 from librar.mysql import sql_server as sql
-from librar.log import log, init as log_init
+from librar.log import log, context as log_context, init as log_init
 from librar import sigprocs
 from librar import accounts
 from librar import sales
@@ -34,19 +34,22 @@ def process_order(order_db):
     if not ok:
         return False, f"Domain {order_db['domain_id']} not found"
 
-    ok, trans_id = accounts.apply_transaction(
-        user_db["user_id"], (-1 * order_db["price_paid"]),
-        f"{order_db['order_type']} on {dom_db['name']} for {order_db['num_years']} yrs")
+    with sql.transaction():
+        ok, trans_id = accounts.apply_transaction(
+            user_db["user_id"], (-1 * order_db["price_paid"]),
+            f"{order_db['order_type']} on {dom_db['name']} for {order_db['num_years']} yrs")
 
-    if not ok:
-        return False, f"Account debit failed - {trans_id}"
+        if not ok:
+            sql.fail_transaction()
+            return False, f"Account debit failed - {trans_id}"
+
+        ok, sold_id = sales.sold_item(trans_id, order_db, dom_db, user_db)
+        if ok and sold_id:
+            sql.sql_update_one("transactions", {"sales_item_id": sold_id}, {"transaction_id": trans_id})
 
-    ok, sold_id = sales.sold_item(trans_id, order_db, dom_db, user_db)
-    if ok and sold_id:
-        sql.sql_update_one("transactions", {"sales_item_id": sold_id}, {"transaction_id": trans_id})
+        backend_creator.make_job(order_db["order_type"], dom_db, order_db["num_years"], order_db["authcode"])
+        sql.sql_delete_one("orders", {"order_item_id": order_db["order_item_id"]})
 
-    backend_creator.make_job(order_db["order_type"], dom_db, order_db["num_years"], order_db["authcode"])
-    sql.sql_delete_one("orders", {"order_item_id": order_db["order_item_id"]})
     return True, "Worked"
 
 
@@ -56,9 +59,10 @@ def run_server(max_wait=DEFAULT_WAIT):
     while True:
         ok, order_db = get_next_order_to_clear()
         if ok and len(order_db) > 0:
-            ok, reply = process_order(order_db[0])
-            if not ok:
-                log(f"PAY-ENGINE ERR: {reply}")
+            with log_context(job=f"ORD-{order_db[0]['order_item_id']}"):
+                ok, reply = process_order(order_db[0])
+                if not ok:
+                    log(f"PAY-ENGINE ERR: {reply}")
         else:
             signal_mtime = sigprocs.signal_wait("payeng", signal_mtime, max_wait=max_wait)
             registry.tld_lib.check_for_new_files()
@@ -3,11 +3,25 @@
 # Alternative license arrangements possible, contact me for more information
 
 from librar.log import init as log_init
+from librar import mysql
 from librar.mysql import sql_server as sql
 from librar import misc, sigprocs, static, validate
 
 
 def apply_transaction(user_id, amount, desc, as_admin=False):
+    with sql.transaction():
+        ok, reply = debit_account(user_id, amount, desc, as_admin)
+        if not ok:
+            sql.fail_transaction()
+            return False, reply
+
+    if amount > 0:
+        sigprocs.signal_service("payeng")
+
+    return True, reply
+
+
+def debit_account(user_id, amount, desc, as_admin):
     set_clauses = [
         "acct_previous_balance = (@prev := acct_current_balance)",
         f"acct_current_balance = (@newbal := acct_current_balance + {amount})",
@@ -32,20 +46,15 @@ def apply_transaction(user_id, amount, desc, as_admin=False):
 
     set_trans = [
         f"user_id = {user_id}", "acct_sequence_id = @trnum", f"amount = {amount}", "pre_balance = @prev",
-        "post_balance = @newbal", "description = unhex('" + misc.ashex(desc.encode("utf8")) + "')",
-        "created_dt = now()"
+        "post_balance = @newbal", f"description = {mysql.PARAM}", "created_dt = now()"
     ]
     sql_cmd = "insert into transactions set " + ",".join(set_trans)
 
-    row_count, row_id = sql.sql_exec(sql_cmd)
+    row_count, row_id = sql.sql_exec(sql_cmd, [desc])
     if not row_count or not row_id:
         return False, row_id
 
     sql.sql_exec("select @trnum=NULL,@newbal=NULL,@prev=NULL")
-
-    if amount > 0:
-        sigprocs.signal_service("payeng")
-
     return True, row_id
 
 
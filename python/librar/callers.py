@@ -0,0 +1,34 @@
+#! /usr/bin/python3
+# (c) Copyright 2019-2023, James Stevens ... see LICENSE for details
+# Alternative license arrangements possible, contact me for more information
+""" find who called us, for logging, reading one stack frame instead of `inspect.stack()` """
+
+import os
+import sys
+import collections
+
+Where = collections.namedtuple("Where", ["filename", "lineno", "function"])
+
+
+def where_of_frame(frame):
+    return Where(frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+
+def caller(depth=1):
+    """ file, line & function {depth} frames above the function calling us, `1` = its caller """
+    return where_of_frame(sys._getframe(depth + 1))
+
+
+def where_txt(where):
+    """ {where} as `[program:line/function]` """
+    if where is None:
+        return ""
+    return f"[{where.filename.split('/')[-1].split('.')[0]}:{where.lineno}/{where.function}]"
+
+
+def daemon_name():
+    """ name of this program, e.g. `run_backend.py` -> `backend`, gunicorn apps are named by their directory """
+    name = os.path.basename(sys.argv[0]).split(".")[0]
+    if name == "gunicorn":
+        return os.path.basename(os.getcwd())
+    return name[4:] if name[:4] == "run_" else name
@@ -14,6 +14,43 @@ from librar import misc
 from librar.policy import this_policy as policy
 
 
+def zone_context(tld):
+    """ what every domain in zone {tld} has in common, so it is only worked out once per zone """
+    tld_rec = registry.tld_lib.zone_data[tld]
+    reg_data = tld_rec["reg_data"]
+    return {
+        "tld": tld,
+        "tld_rec": tld_rec,
+        "registry": reg_data,
+        "transfer_stop": misc.now(reg_data["domain_transfer_age"] * -86400),
+        "permitted_locks": reg_data["locks"] if "locks" in reg_data else static.CLIENT_DOM_FLAGS,
+        "strict_idna2008": reg_data["strict_idna2008"] if "strict_idna2008" in reg_data else None
+    }
+
+
+def check_names(dom_list):
+    """ validate & lower-case a list of names in one pass, grouped by zone
+        returns {name: zone} (in the order given), {zone: context} & {name: error} for those that failed """
+    names = {}
+    zones = {}
+    errors = {}
+    for name in dom_list:
+        if not isinstance(name, str) or name.find(".") < 0:
+            names[name := str(name).lower()] = None
+            errors[name] = "Invalid domain name"
+            continue
+        names[name := name.lower()] = tld = registry.tld_lib.zone_of_domain(name)
+        if tld is None:
+            errors[name] = "TLD not supported"
+            continue
+        if tld not in zones:
+            zones[tld] = zone_context(tld)
+        if not validate.is_valid_fqdn(name, zones[tld]["strict_idna2008"]):
+            errors[name] = "Invalid domain name"
+
+    return {"names": names, "zones": zones, "errors": errors}
+
+
 class Domain:
     """ domain handler """
     def __init__(self):
@@ -43,25 +80,27 @@ class Domain:
     def set_name(self, name):
         """ check the name is valid & find its registry """
         name = name.lower()
-        if (idx := name.find(".")) < 0:
+        if name.find(".") < 0:
             return False, "Invalid domain name"
-        tld = name[idx + 1:]
-        if tld not in registry.tld_lib.zone_data:
+        if (tld := registry.tld_lib.zone_of_domain(name)) is None:
             return False, "TLD not supported"
 
-        self.tld = tld
-        self.tld_rec = registry.tld_lib.zone_data[self.tld]
-        self.registry = self.tld_rec["reg_data"]
-        self.transfer_stop = misc.now(self.registry["domain_transfer_age"] * -86400)
-        self.permitted_locks = self.registry["locks"] if "locks" in self.registry else static.CLIENT_DOM_FLAGS
-        self.strict_idna2008 = self.registry["strict_idna2008"] if "strict_idna2008" in self.registry else None
-
+        self.set_zone(zone_context(tld))
         if not validate.is_valid_fqdn(name, self.strict_idna2008):
             return False, "Invalid domain name"
 
         self.name = name
         return True, None
 
+    def set_zone(self, context):
+        """ set the zone properties from a `zone_context` """
+        self.tld = context["tld"]
+        self.tld_rec = context["tld_rec"]
+        self.registry = context["registry"]
+        self.transfer_stop = context["transfer_stop"]
+        self.permitted_locks = context["permitted_locks"]
+        self.strict_idna2008 = context["strict_idna2008"]
+
     def load_name(self, name, user_id=None):
         if not (reply := self.set_name(name))[0]:
             return False, reply[1]
@@ -143,18 +182,20 @@ class DomainList:
 
     def process_list(self, dom_list):
         self.domobjs = {}
-        for name in dom_list:
-            this_domobj = Domain()
-            ok, reply = this_domobj.set_name(name)
-            if not ok:
-                return False, reply
+        checked = check_names(dom_list)
+        for name, tld in checked["names"].items():
+            if name in checked["errors"]:
+                return False, checked["errors"][name]
+            context = checked["zones"][tld]
             if self.registry is None:
-                self.registry = this_domobj.registry
-                self.transfer_stop = misc.now(self.registry["domain_transfer_age"] * -86400)
-            else:
-                if self.registry["name"] != this_domobj.registry["name"]:
-                    return False, "ERROR: Split registry request"
-            self.domobjs[this_domobj.name] = this_domobj
+                self.registry = context["registry"]
+                self.transfer_stop = context["transfer_stop"]
+            elif self.registry["name"] != context["registry"]["name"]:
+                return False, "ERROR: Split registry request"
+            this_domobj = Domain()
+            this_domobj.set_zone(context)
+            this_domobj.name = name
+            self.domobjs[name] = this_domobj
         return True, None
 
     def load_all(self):
@@ -6,14 +6,14 @@
 import sys
 import os
 import json
-import inspect
 import syslog
 
+from librar import filewatch
+from librar.callers import caller, where_txt
+
 
 def load_file_json(filename):
-    where = inspect.stack()[1]
-    fname = where.filename.split("/")[-1].split(".")[0]
-    txt = f"[{fname}:{str(where.lineno)}/{where.function}]"
+    txt = where_txt(caller())
     syslog.syslog(syslog.LOG_NOTICE, f"{txt} -> Reloading file '{filename}'")
     try:
         with open(filename, "r", encoding='UTF-8') as file_fd:
@@ -41,19 +41,24 @@ def have_newer(mtime, file_name):
 
 
 class FileLoader:
-    """ load & update a json file """
+    """ load & update a json file, only looking at the file when `filewatch` says it has changed """
     def __init__(self, filename):
         self.filename = filename
         self.last_mtime = 0
+        self.generation = None
         self.json = None
         self.check_for_new()
 
     def check_for_new(self):
+        if (generation := filewatch.generation(self.filename)) == self.generation:
+            return False
         if (new_time := have_newer(self.last_mtime, self.filename)) is None:
+            self.generation = generation
             return False
         if (data := load_file_json(self.filename)) is not None:
             self.json = data
             self.last_mtime = new_time
+            self.generation = generation
             return True
         return False
 
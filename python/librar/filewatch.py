@@ -0,0 +1,152 @@
+#! /usr/bin/python3
+# (c) Copyright 2019-2023, James Stevens ... see LICENSE for details
+# Alternative license arrangements possible, contact me for more information
+""" notice when config files change, using inotify, so checking costs nothing until they do """
+
+import os
+import sys
+import time
+import ctypes
+import struct
+import syslog
+import threading
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+STAT_CHECK_SECS = 2
+
+
+def file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    except OSError:
+        return None
+
+
+class FileWatcher:
+    """ keep a generation number for each watched file, which goes up each time it changes
+        with inotify a thread bumps the generation, otherwise we `stat` each file at most every `STAT_CHECK_SECS` """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generations = {}
+        self.by_dir = {}
+        self.stamps = {}
+        self.checked_at = {}
+        self.inotify_fd = None
+        self.watches = {}
+        self.stat_only = set()
+        self.pid = None
+        self.use_inotify = sys.platform.startswith("linux")
+        self.libc = None
+
+    def start(self):
+        """ open inotify & start the reader thread, again in a forked child, which does not inherit threads """
+        self.pid = os.getpid()
+        self.inotify_fd = None
+        self.watches = {}
+        self.stat_only = set(self.generations)
+        if not self.use_inotify:
+            return
+        try:
+            if self.libc is None:
+                self.libc = ctypes.CDLL(None, use_errno=True)
+            if (inotify_fd := self.libc.inotify_init1(IN_CLOEXEC)) < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        except (OSError, AttributeError) as exc:
+            syslog.syslog(syslog.LOG_NOTICE, f"inotify not available, checking files every {STAT_CHECK_SECS}s: {exc}")
+            self.use_inotify = False
+            return
+        self.inotify_fd = inotify_fd
+        for dirname in self.by_dir:
+            if self.add_watch(dirname):
+                self.stat_only -= set(self.by_dir[dirname].values())
+        threading.Thread(target=self.run, args=(inotify_fd, ), name="file-watcher", daemon=True).start()
+
+    def add_watch(self, dirname):
+        """ watch the directory, not the file, as editors often replace the file, which would lose a file watch """
+        if (wd := self.libc.inotify_add_watch(self.inotify_fd, dirname.encode(), WATCH_MASK)) < 0:
+            syslog.syslog(syslog.LOG_NOTICE, f"inotify can not watch '{dirname}', checking its files with stat")
+            return False
+        self.watches[wd] = dirname
+        return True
+
+    def watch(self, filename):
+        """ start watching {filename}, returns its generation """
+        with self.lock:
+            if self.pid != os.getpid():
+                self.start()
+            if filename in self.generations:
+                return self.generations[filename]
+            dirname, basename = os.path.split(os.path.abspath(filename))
+            self.generations[filename] = 1
+            self.stamps[filename] = file_stamp(filename)
+            self.checked_at[filename] = time.time()
+            if dirname not in self.by_dir:
+                self.by_dir[dirname] = {}
+                if self.inotify_fd is not None:
+                    self.add_watch(dirname)
+            self.by_dir[dirname][basename] = filename
+            if dirname not in self.watches.values():
+                self.stat_only.add(filename)
+            return self.generations[filename]
+
+    def generation(self, filename):
+        """ current generation of {filename}, a dict lookup when inotify is watching it """
+        if self.pid != os.getpid() or filename not in self.generations:
+            return self.watch(filename)
+        if filename in self.stat_only:
+            self.stat_check(filename)
+        return self.generations[filename]
+
+    def stat_check(self, filename):
+        now = time.time()
+        if now - self.checked_at[filename] < STAT_CHECK_SECS:
+            return
+        self.checked_at[filename] = now
+        if (stamp := file_stamp(filename)) != self.stamps[filename]:
+            self.stamps[filename] = stamp
+            self.generations[filename] += 1
+
+    def changed(self, dirname, name):
+        if name is None:
+            for filename in self.by_dir.get(dirname, {}).values():
+                self.generations[filename] += 1
+        elif (filename := self.by_dir.get(dirname, {}).get(name)) is not None:
+            self.generations[filename] += 1
+
+    def run(self, inotify_fd):
+        while True:
+            try:
+                buffer = os.read(inotify_fd, 4096)
+            except OSError:
+                return
+            pos = 0
+            while pos + EVENT_HEADER.size <= len(buffer):
+                wd, mask, __, name_len = EVENT_HEADER.unpack_from(buffer, pos)
+                name = buffer[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + name_len].rstrip(b"\0").decode()
+                pos += EVENT_HEADER.size + name_len
+                with self.lock:
+                    if mask & IN_Q_OVERFLOW:
+                        for dirname in self.by_dir:
+                            self.changed(dirname, None)
+                    elif wd in self.watches:
+                        self.changed(self.watches[wd], name)
+
+
+file_watcher = FileWatcher()
+
+
+def generation(filename):
+    return file_watcher.generation(filename)
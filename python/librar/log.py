@@ -3,12 +3,25 @@
 # Alternative license arrangements possible, contact me for more information
 """ functions for sys-logging """
 
+import os
+import re
 import sys
+import json
+import time
+import queue
+import atexit
 import syslog
-import inspect
 import datetime
+import threading
+import contextlib
 
 from librar.policy import this_policy as policy
+from librar.callers import caller, where_txt, daemon_name
+
+LOGS_DIR = f"{os.environ['BASE']}/storage/perm/logs"
+SINK_STOP_WAIT = 5
+SYSLOG_SKIP_ITEMS = {"when", "daemon", "pid", "level", "caller", "msg"}
+IS_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
 
 DONE_INIT = False
 
@@ -53,32 +66,208 @@ severity_options = {
     "debug": syslog.LOG_DEBUG
 }
 
+severity_names = {
+    syslog.LOG_EMERG: "emerg",
+    syslog.LOG_ALERT: "alert",
+    syslog.LOG_CRIT: "crit",
+    syslog.LOG_ERR: "err",
+    syslog.LOG_WARNING: "warning",
+    syslog.LOG_NOTICE: "notice",
+    syslog.LOG_INFO: "info",
+    syslog.LOG_DEBUG: "debug"
+}
 
-def debug(line, where=None):
-    if where is None:
-        where = inspect.stack()[1]
-    if HOLD_DEBUG:
-        log("[DEUBG] " + line, where)
+this_context = threading.local()
+
+
+def start_context(**items):
+    """ tag this thread's log records with {items}, e.g. `request` or `job` id, & time how long it runs """
+    this_context.items = items
+    this_context.started = time.time()
+
+
+def request_id(given=None):
+    """ {given} id, e.g. from a `X-Request-ID` header, if it is safe to log, otherwise a new one """
+    if given is not None and IS_REQUEST_ID.fullmatch(given):
+        return given
+    return os.urandom(6).hex()
+
+
+def end_context():
+    this_context.items = None
+
+
+@contextlib.contextmanager
+def context(**items):
+    start_context(**items)
+    try:
+        yield
+    finally:
+        end_context()
+
+
+def make_record(line, txt, level):
+    record = {
+        "when": datetime.datetime.now().isoformat(timespec="milliseconds"),
+        "daemon": log_sink.daemon,
+        "pid": log_sink.pid,
+        "level": severity_names.get(level, str(level)),
+        "caller": txt,
+        "msg": line
+    }
+    if (items := getattr(this_context, "items", None)) is not None:
+        record.update(items)
+        record["duration"] = round(time.time() - this_context.started, 3)
+    return record
+
+
+def syslog_line(record):
+    """ syslog adds its own time, program & pid, so just add the context items as `tag=value` """
+    tags = "".join([f" {tag}={val}" for tag, val in record.items() if tag not in SYSLOG_SKIP_ITEMS])
+    return f"{record['caller']} {record['msg']}{tags}"
+
+
+class LogSink:
+    """ queue log records & write them in batches from a background thread, so logging never blocks the caller
+        to syslog, or a rotating JSONL file per daemon, by policy `log_sink`. When the queue is full, records are
+        dropped & counted """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.daemon = None
+        self.stats = {"queued": 0, "written": 0, "dropped": 0}
+        self.dropped = 0
+
+    def start(self):
+        """ start the writer thread, or restart it in a forked child, which does not inherit threads """
+        with self.lock:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.daemon = daemon_name()
+            self.queue = queue.Queue(maxsize=policy.policy("log_queue_size"))
+            self.thread = threading.Thread(target=self.run, name="log-sink", daemon=True)
+            self.thread.start()
 
+    def add(self, line, txt, level):
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait([make_record(line, txt, level), level])
+            self.stats["queued"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+            self.dropped += 1
 
-def log(line, where=None, default_level=syslog.LOG_NOTICE):
-    if where is None:
-        where = inspect.stack()[1]
-    txt = ""
-    if where is not None:
-        fname = where.filename.split("/")[-1].split(".")[0]
-        txt = f"[{fname}:{str(where.lineno)}/{where.function}]"
+    def next_batch(self, batch_size):
+        if (item := self.queue.get()) is None:
+            return [], True
+        batch = [item]
+        while len(batch) < batch_size:
+            try:
+                if (item := self.queue.get_nowait()) is None:
+                    return batch, True
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch, False
+
+    def run(self):
+        batch_size = policy.policy("log_batch_size")
+        stop = False
+        while not stop:
+            batch, stop = self.next_batch(batch_size)
+            if self.dropped:
+                batch.append([
+                    make_record(f"{self.dropped} log records dropped, queue full", "", syslog.LOG_WARNING),
+                    syslog.LOG_WARNING
+                ])
+                self.dropped = 0
+            if batch:
+                self.write(batch)
+
+    def write(self, batch):
+        try:
+            if policy.policy("log_sink") == "jsonl":
+                self.write_jsonl(batch)
+            else:
+                for record, level in batch:
+                    syslog.syslog(level, syslog_line(record))
+            self.stats["written"] += len(batch)
+        except Exception as exc:
+            print(f"ERROR: Failed to write {len(batch)} log records: {exc}", file=sys.stderr)
+
+    def write_jsonl(self, batch):
+        filename = os.path.join(LOGS_DIR, f"{self.daemon}.jsonl")
+        if not os.path.isdir(LOGS_DIR):
+            os.makedirs(LOGS_DIR, mode=0o777, exist_ok=True)
+        with open(filename, "a", encoding="utf-8") as fd:
+            fd.write("".join([json.dumps(record, default=str) + "\n" for record, __ in batch]))
+            size = fd.tell()
+        if size >= policy.policy("log_jsonl_max_size"):
+            self.rotate(filename)
+
+    def rotate(self, filename):
+        """ `daemon.jsonl` -> `daemon.jsonl.1` etc, keeping `log_jsonl_keep` old files """
+        keep = policy.policy("log_jsonl_keep")
+        try:
+            for num in range(keep - 1, 0, -1):
+                if os.path.isfile(f"{filename}.{num}"):
+                    os.replace(f"{filename}.{num}", f"{filename}.{num+1}")
+            os.replace(filename, f"{filename}.1")
+        except OSError:
+            pass
+
+    def flush(self):
+        """ write all queued records & stop the thread, e.g. when the process exits """
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid():
+                return
+            thread = self.thread
+            self.thread = None
+            self.pid = None
+        try:
+            self.queue.put(None, timeout=SINK_STOP_WAIT)
+            thread.join(SINK_STOP_WAIT)
+        except queue.Full:
+            pass
+
+
+log_sink = LogSink()
+atexit.register(log_sink.flush)
+
+
+def debug_enabled():
+    return HOLD_DEBUG
+
+
+def debug(line, *args, where=None):
+    """ log {line} % {args} in debug mode only, the caller & formatting are only worked out if it will be logged """
+    if not HOLD_DEBUG:
+        return
+    log("[DEUBG] " + line, *args, where=where or caller())
+
+
+def log(line, *args, where=None, default_level=syslog.LOG_NOTICE):
+    """ log {line} % {args}, tagged with where it was called from, unless {where} is given """
+    if not HOLD_DEBUG:
+        if not DONE_INIT:
+            init()
+        if not HOLD_WITH_LOGGING:
+            return
+    if args:
+        line = line % args
+    txt = where_txt(where or caller())
     if HOLD_DEBUG:
         now = datetime.datetime.now()
         now_txt = now.strftime("%Y-%m-%d %H:%M:%S")
         print(f"{now_txt} SYSLOG{txt} {line}")
     else:
-        if not DONE_INIT:
-            init()
-        if HOLD_WITH_LOGGING:
-            if isinstance(default_level, str):
-                default_level = severity_options[default_level]
-            syslog.syslog(default_level, txt + " " + line)
+        if isinstance(default_level, str):
+            default_level = severity_options[default_level]
+        log_sink.add(line, txt, default_level)
 
 
 def check_off(this_facility, also_check_none=False):
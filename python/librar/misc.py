@@ -6,33 +6,44 @@
 import os
 import datetime
 import sys
+import functools
 import idna
 from dateutil.relativedelta import relativedelta
 
-from librar.policy import this_policy as policy
+from librar.policy import this_policy as policy, policy_defaults
 from librar import static
 
-HEXLIB = "0123456789ABCDEF"
+MYSQL_DATETIME = "%Y-%m-%d %H:%M:%S"
+
+
+def idn_cache_size():
+    """ `idn_cache_size` from policy, only read at start-up, as an `lru_cache` can not be resized """
+    try:
+        return int(policy.policy("idn_cache_size"))
+    except (TypeError, ValueError):
+        return policy_defaults["idn_cache_size"]
+
+
+IDN_CACHE_SIZE = idn_cache_size()
 
 
 def ashex(line):
     if isinstance(line, int):
-        out_hex = ""
-        while line > 0:
-            out_hex = HEXLIB[line & 0xf] + out_hex
-            line = line >> 4
-        return out_hex if len(out_hex) > 0 else "0"
+        return f"{line:X}" if line > 0 else "0"
     if isinstance(line, str):
         line = line.encode("utf-8")
-    ret = ""
-    for asc in line:
-        ret += HEXLIB[asc >> 4] + HEXLIB[asc & 0xf]
-    return ret
+    return line.hex().upper()
 
 
 def puny_to_utf8(name, strict_idna_2008=None):
     if strict_idna_2008 is None:
         strict_idna_2008 = policy.policy("strict_idna2008")
+    return cached_puny_to_utf8(name, bool(strict_idna_2008))
+
+
+@functools.lru_cache(maxsize=IDN_CACHE_SIZE)
+def cached_puny_to_utf8(name, strict_idna_2008):
+    """ decoding is slow & the same names are decoded again & again, so remember the last `idn_cache_size` """
     try:
         idn = idna.decode(name)
         return idn
@@ -88,16 +99,40 @@ def has_data(row, col):
     return row is not None and len(row) > 0 and col in row and row[col] is not None and row[col] != ""
 
 
-def now(offset=0):
-    time_now = datetime.datetime.now()
+def now(offset=0, native=False):
+    time_now = datetime.datetime.now().replace(microsecond=0)
     time_now += datetime.timedelta(seconds=offset)
-    return time_now.strftime("%Y-%m-%d %H:%M:%S")
+    return time_now if native else time_now.strftime(MYSQL_DATETIME)
+
+
+def now_like(mysql_time, offset=0):
+    """ now, as the same type as {mysql_time}, so they can be compared """
+    return now(offset, isinstance(mysql_time, datetime.datetime))
 
 
 def date_add(mysql_time, days=0, hours=0, years=0):
-    time_now = datetime.datetime.strptime(mysql_time, "%Y-%m-%d %H:%M:%S")
+    """ add to {mysql_time}, which can be a `datetime` or MySQL date string, returning the same type """
+    if isinstance(mysql_time, datetime.datetime):
+        return mysql_time + relativedelta(days=days, hours=hours, years=years)
+    time_now = datetime.datetime.strptime(mysql_time, MYSQL_DATETIME)
     time_now += relativedelta(days=days, hours=hours, years=years)
-    return time_now.strftime("%Y-%m-%d %H:%M:%S")
+    return time_now.strftime(MYSQL_DATETIME)
+
+
+def date_str(mysql_time):
+    """ {mysql_time} as a MySQL date string, whether it is a `datetime` or already a string """
+    if isinstance(mysql_time, datetime.datetime):
+        return mysql_time.strftime(MYSQL_DATETIME)
+    return mysql_time
+
+
+def json_default(data):
+    """ `default` for `json.dump`, so `datetime`s are output as MySQL date strings """
+    if isinstance(data, datetime.datetime):
+        return data.strftime(MYSQL_DATETIME)
+    if isinstance(data, datetime.date):
+        return data.isoformat()
+    raise TypeError(f"Object of type {type(data).__name__} is not JSON serializable")
 
 
 def make_year_month_day_dir(start_dir):
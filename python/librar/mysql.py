@@ -4,25 +4,68 @@
 """ Code for interacting with MySQL """
 
 import os
+import re
 import sys
 import json
+import time
+import queue
+import atexit
 import yaml
-import inspect
+import tempfile
+import functools
+import contextlib
+import threading
+import collections
 
 from MySQLdb import _mysql
 from MySQLdb.constants import FIELD_TYPE
 import MySQLdb.converters
 
-from librar import fileloader, misc, static
-from librar.log import log, debug, init as log_init
+from librar import fileloader, filewatch, misc, static
+from librar.log import log, debug, debug_enabled, init as log_init
+from librar.callers import caller, where_of_frame
+from librar.sqlstats import sql_stats
+from librar.policy import this_policy as policy
 
 ALL_CREDENTIALS = ["database", "username", "password", "server"]
 
 INTS = {"tinyint", "int", "decimal"}
 
+PARAM = "\x00"
+INSERT_MANY_BYTES = 256 * 1024
+SELECT_BATCH_ROWS = 500
 
-def sort_elm(fld_elm):
-    return fld_elm["Field"]
+POOL_DEFAULTS = {"min_size": 1, "max_size": 10, "idle_timeout": 300, "wait_timeout": 30, "ping_interval": 30}
+SERVER_HAS_GONE = {2006, 2013}
+
+REPLICA_DEFAULTS = {"server": None, "logins": ["webui", "admin"], "window": 5}
+REPLICA_RETRY = 30
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR = f"{os.environ['BASE']}/storage/shared/schema"
+
+EVENTS_DIR = f"{os.environ['BASE']}/storage/perm/events"
+EVENTS_STOP_WAIT = 5
+
+CACHE_DIR = f"{os.environ['BASE']}/storage/shared/cache"
+CACHE_GEN_MAX_SIZE = 4096
+# generation is always kept, even if not cached, `ZoneLib` & the `local` class index reload when they change
+WATCHED_TABLES = ["zones", "class_by_name", "class_by_regexp"]
+WRITE_SQL = re.compile(r"^\s*(?:update|insert\s+(?:ignore\s+)?into|replace\s+into|delete\s+from)\s+`?(\w+)", re.I)
+
+SCHEMA_COLUMNS_SQL = ("select table_name 'table_name',column_name 'Field',column_type 'Type',is_nullable 'Null'," +
+                      "column_default 'Default',extra 'Extra' from information_schema.columns " +
+                      "where table_schema = database() order by table_name,column_name")
+SCHEMA_INDEXES_SQL = ("select table_name 'table_name',index_name 'index_name',column_name 'column_name'," +
+                      "non_unique 'non_unique' from information_schema.statistics " +
+                      "where table_schema = database() order by table_name,index_name,seq_in_index")
+SCHEMA_CHECKSUM_SQL = (
+    "select (select count(*) from information_schema.columns where table_schema = database()) 'num_cols'," +
+    "(select sum(crc32(concat_ws('|',table_name,column_name,column_type,is_nullable,column_default,extra))) " +
+    "from information_schema.columns where table_schema = database()) 'cols'," +
+    "(select count(*) from information_schema.statistics where table_schema = database()) 'num_idxs'," +
+    "(select sum(crc32(concat_ws('|',table_name,index_name,column_name,non_unique,seq_in_index))) " +
+    "from information_schema.statistics where table_schema = database()) 'idxs'")
 
 
 def convert_string(data):
@@ -42,10 +85,14 @@ my_conv[FIELD_TYPE.TINY_BLOB] = convert_string
 my_conv[FIELD_TYPE.MEDIUM_BLOB] = convert_string
 my_conv[FIELD_TYPE.LONG_BLOB] = convert_string
 my_conv[FIELD_TYPE.BLOB] = convert_string
+
 my_conv[FIELD_TYPE.TINY] = int
 my_conv[FIELD_TYPE.DECIMAL] = int
 my_conv[FIELD_TYPE.NEWDECIMAL] = int
 
+native_dates_conv = my_conv.copy()
+native_dates_conv[FIELD_TYPE.DATETIME] = MySQLdb.converters.conversions[FIELD_TYPE.DATETIME]
+
 
 def add_join_items(new_schema):
     """ add `join` items to columns that join """
@@ -69,6 +116,48 @@ def find_join_dest(table, col, jns):
     return None
 
 
+def add_index_to_schema(indexes, col):
+    """ Add index column {col} from `information_schema.statistics` to {indexes} """
+    key = col["index_name"] if col["index_name"] != "PRIMARY" else ":primary:"
+    if key not in indexes:
+        indexes[key] = {"columns": []}
+    indexes[key]["columns"].append(col["column_name"])
+    indexes[key]["unique"] = col["non_unique"] == 0
+
+
+def snapshot_filename(database):
+    return os.path.join(SNAPSHOT_DIR, f"{database}.json")
+
+
+def load_schema_snapshot(database, checksum):
+    """ return saved schema of {database}, if it exists & matches {checksum} """
+    if checksum is None or not os.path.isfile(filename := snapshot_filename(database)):
+        return None
+    try:
+        with open(filename, "r", encoding="utf-8") as fd:
+            snapshot = json.load(fd)
+    except (ValueError, IOError):
+        return None
+    if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("checksum") != checksum:
+        return None
+    return snapshot["schema"]
+
+
+def save_schema_snapshot(database, checksum, schema):
+    """ save {schema} of {database} for the next process that starts up """
+    if checksum is None:
+        return
+    try:
+        if not os.path.isdir(SNAPSHOT_DIR):
+            os.makedirs(SNAPSHOT_DIR, mode=0o777, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=SNAPSHOT_DIR, delete=False) as fd:
+            json.dump({"version": SNAPSHOT_VERSION, "checksum": checksum, "schema": schema}, fd)
+        os.chmod(fd.name, 0o644)
+        os.replace(fd.name, snapshot_filename(database))
+    except IOError as exc:
+        log(f"Failed to save schema snapshot for '{database}': {exc}")
+
+
 def load_more_schema(new_schema):
     """ load users file of additional schema information """
     new_schema[":more:"] = {}
@@ -80,6 +169,15 @@ def load_more_schema(new_schema):
             return
 
 
+def unquote_default(default):
+    """ `information_schema` in MariaDB quotes string defaults & gives `NULL` as a string, unlike `describe` """
+    if default is None or default == "NULL":
+        return None
+    if len(default) >= 2 and default[0] == "'" and default[-1] == "'":
+        return default[1:-1].replace("''", "'")
+    return default
+
+
 def schema_of_col(new_schema, col):
     """ convert MySQL column description into JSON schema """
     this_field = {}
@@ -137,7 +235,7 @@ def test_plain_int(this_type, this_places):
 
 
 def event_log(other_items, stack_pos=2):
-    where = inspect.stack()[stack_pos]
+    where = caller(stack_pos)
     event_db = {
         "program": where.filename.split("/")[-1].split(".")[0],
         "function": where.function,
@@ -145,115 +243,549 @@ def event_log(other_items, stack_pos=2):
         "when_dt": None
     }
     event_db.update(other_items)
-    sql_server.sql_insert("events", event_db)
+    event_writer.add(event_db)
+
+
+def is_now_column(column):
+    return column in static.NOW_DATE_FIELDS or column[-3:] == "_dt"
+
+
+def shape_of_data(data):
+    """ split dict {data} into its shape (each column & kind of value) and the list of values """
+    shape = []
+    params = []
+    for column, value in data.items():
+        if value is None:
+            shape.append((column, "now" if is_now_column(column) else "null"))
+        elif isinstance(value, list):
+            shape.append((column, len(value)))
+            params.extend(value)
+        else:
+            shape.append((column, "value"))
+            params.append(value)
+    return tuple(shape), params
 
 
-def format_col(column, value, is_set=False):
-    """ convert {value} to SQL string """
-    if column is not None and value is None and (column in static.NOW_DATE_FIELDS or column[-3:] == "_dt"):
+def column_of_shape(column, kind, is_set):
+    """ SQL for one {column} of a shape, with `PARAM` where each value goes """
+    if kind == "now":
         return f"{column}=now()"
+    if kind == "null":
+        return f"{column} = NULL" if is_set else f"{column} is NULL"
+    if isinstance(kind, int):
+        return column + " in (" + ",".join([PARAM] * kind) + ")"
+    return f"{column} = {PARAM}"
 
-    if value is None:
-        if is_set:
-            return f"{column} = NULL"
-        return f"{column} is NULL"
 
-    if isinstance(value, int):
-        return (column + "=" + str(int(value))) if column else str(int(value))
+@functools.lru_cache(maxsize=1024)
+def clause_of_shape(shape, joiner, is_set=False):
+    """ SQL for a clause of {shape}, cached as the same shapes are used over & over """
+    return joiner.join([column_of_shape(column, kind, is_set) for column, kind in shape])
 
-    if isinstance(value, list):
-        return column + " in (" + ",".join(format_col(None, this_val) for this_val in value) + ")"
 
+def data_set(data, joiner, is_set=False):
+    """ create `col=val` clause from dict {data}, joined by {joiner}, & the values for its params """
+    if data is None:
+        return None, []
+    if isinstance(data, str):
+        return data, []
+    shape, params = shape_of_data(data)
+    return clause_of_shape(shape, joiner, is_set), params
+
+
+def sql_literal(cnx, value):
+    """ convert {value} to SQL, using the C escaping of connection {cnx} """
+    if isinstance(value, int):
+        return str(int(value))
     if not isinstance(value, str):
         value = str(value)
+    return cnx.string_literal(value.encode("utf8")).decode("utf8")
+
+
+def fill_params(cnx, sql, params):
+    """ replace each `PARAM` in {sql} with the SQL literal of the matching item in {params} """
+    if not params:
+        return sql
+    frags = sql.split(PARAM)
+    if len(frags) != len(params) + 1:
+        raise ValueError(f"SQL has {len(frags) - 1} params, but {len(params)} values were given")
+    filled = [frags[0]]
+    for value, frag in zip(params, frags[1:]):
+        filled.append(sql_literal(cnx, value))
+        filled.append(frag)
+    return "".join(filled)
+
+
+def values_of_row(columns, row):
+    """ SQL `(..)` values for {columns} of one {row} of a multi-row insert, & its params """
+    values = []
+    params = []
+    for column in columns:
+        if (value := row[column]) is None:
+            values.append("now()" if is_now_column(column) else "NULL")
+        else:
+            values.append(PARAM)
+            params.append(value)
+    return "(" + ",".join(values) + ")", params
+
+
+def chunk_rows(start_sql, columns, rows):
+    """ split {rows} into multi-row inserts of about `INSERT_MANY_BYTES`, each starting with {start_sql}
+        yields the SQL, its params & how many rows are in it """
+    values = []
+    params = []
+    size = len(start_sql)
+    for row in rows:
+        row_values, row_params = values_of_row(columns, row)
+        row_size = len(row_values) + sum(len(str(value)) + 2 for value in row_params)
+        if values and size + row_size > INSERT_MANY_BYTES:
+            yield start_sql + ",".join(values), params, len(values)
+            values = []
+            params = []
+            size = len(start_sql)
+        values.append(row_values)
+        params.extend(row_params)
+        size += row_size + 1
+    if values:
+        yield start_sql + ",".join(values), params, len(values)
+
+
+def fetch_batches(res, batch_size):
+    """ yield lists of up to {batch_size} rows from unbuffered result {res}
+        any rows not read are thrown away, so the connection can be used again """
+    try:
+        while rows := res.fetch_row(maxrows=batch_size, how=1):
+            yield list(rows)
+    finally:
+        while res.fetch_row(maxrows=batch_size):
+            pass
 
-    ret = "unhex('" + misc.ashex(value.encode("utf8")) + "')"
-
-    if column is not None:
-        ret = column + " = " + ret
 
-    return ret
+def rows_of_result(ret):
+    """ number of rows selected or changed, from the return of `sql_run` """
+    if isinstance(ret[1], list):
+        return len(ret[1])
+    if isinstance(ret[0], int) and not isinstance(ret[0], bool):
+        return ret[0]
+    return 0
 
 
-def data_set(data, joiner, is_set=False):
-    """ create list of `col=val` from dict {data}, joined by {joiner} """
-    if data is None:
+def replica_config(mysql_json):
+    """ optional read-only replica, either just its server or `{"server": ..., "logins": [...], "window": secs}` """
+    if "replica" not in mysql_json:
         return None
-    if isinstance(data, str):
-        return data
-    return joiner.join([format_col(item, data[item], is_set) for item in data])
+    conf = REPLICA_DEFAULTS.copy()
+    if isinstance(mysql_json["replica"], dict):
+        conf.update(mysql_json["replica"])
+    else:
+        conf["server"] = mysql_json["replica"]
+    return conf if conf["server"] else None
 
 
 def first_not_mysql():
-    for context in inspect.stack():
-        if context.filename[-9:] != "/mysql.py":
-            return context
-    return inspect.stack()[1]
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename[-9:] == "/mysql.py":
+        frame = frame.f_back
+    return where_of_frame(frame) if frame is not None else caller()
 
 
 def log_sql(sql):
-    debug(" SQL " + sql, first_not_mysql())
+    if debug_enabled():
+        debug(" SQL " + sql, where=first_not_mysql())
     # log(f" SQL: {sql}")
 
 
-class MariaDB:
+def close_cnx(cnx):
+    """ close a MySQL connection, ignoring errors as it may already be dead """
+    try:
+        cnx.close()
+    except Exception:
+        pass
+
+
+@functools.lru_cache(maxsize=1024)
+def table_written(sql):
+    """ name of the table the {sql} changes, or None if it does not change one """
+    if (match := WRITE_SQL.match(sql)) is None:
+        return None
+    return match.group(1)
+
+
+def cache_gen_filename(table):
+    return os.path.join(CACHE_DIR, f"{table}.gen")
+
+
+def copy_rows(rows):
+    return [dict(row) for row in rows]
+
+
+class TableCache:
+    """ LRU cache of selects on the tables in policy `sql_cache_tables`, each entry expires after `sql_cache_ttl` secs
+        each table has a generation file, changed by every write, so a write in any process drops the old entries """
     def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self.tables = set(policy.policy("sql_cache_tables"))
+        self.ttl = policy.policy("sql_cache_ttl")
+        self.max_size = policy.policy("sql_cache_size")
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR, mode=0o777, exist_ok=True)
+
+    def generation(self, table):
+        """ current generation of {table}, which changes whenever any process writes to it, a memory read """
+        return filewatch.generation(cache_gen_filename(table))
+
+    def get(self, table, key):
+        """ return the cached rows for {key} & the current generation of {table} """
+        gen = self.generation(table)
+        with self.lock:
+            if (entry := self.entries.get(key)) is None or entry[0] != gen or entry[1] < time.time():
+                self.stats["misses"] += 1
+                return None, gen
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return copy_rows(entry[2]), gen
+
+    def counters(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries))
+
+    def put(self, key, gen, rows):
+        with self.lock:
+            self.entries[key] = [gen, time.time() + self.ttl, copy_rows(rows)]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, table):
+        """ drop our entries for {table} & change its generation, so other processes drop theirs """
+        with self.lock:
+            self.stats["invalidations"] += 1
+            for key in [key for key in self.entries if key[0] == table]:
+                del self.entries[key]
+        try:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR, mode=0o777, exist_ok=True)
+            filename = cache_gen_filename(table)
+            is_new = not os.path.isfile(filename)
+            with open(filename, "ab") as fd:
+                if fd.tell() >= CACHE_GEN_MAX_SIZE:
+                    fd.truncate(0)
+                fd.write(b".")
+            if is_new:
+                os.chmod(filename, 0o666)
+        except OSError as exc:
+            log(f"Failed to update cache generation of '{table}': {exc}")
+
+
+class ConnectionPool:
+    """ pool of MySQL connections for one login, shared by all threads """
+    def __init__(self, open_func, pool_conf):
+        self.open_func = open_func
+        self.conf = POOL_DEFAULTS.copy()
+        if isinstance(pool_conf, dict):
+            self.conf.update({item: pool_conf[item] for item in POOL_DEFAULTS if item in pool_conf})
+        self.idle = []
+        self.num_open = 0
+        self.lock = threading.Condition()
+
+    def checkout(self):
+        """ return an idle connection & when it was last used, or open a new one if we are below `max_size` """
+        with self.lock:
+            self.reap_idle()
+            while not self.idle and self.num_open >= self.conf["max_size"]:
+                if not self.lock.wait(self.conf["wait_timeout"]):
+                    log(f"Timed out waiting for a free MySQL connection, pool size {self.num_open}")
+                    return None, None
+            if self.idle:
+                return self.idle.pop()
+            self.num_open += 1
+
+        if (cnx := self.open_func()) is None:
+            self.forget()
+        return cnx, time.time()
+
+    def checkin(self, cnx, used_at):
+        """ give {cnx}, last used at {used_at}, back to the pool for another thread to use """
+        with self.lock:
+            self.idle.append([cnx, used_at])
+            self.lock.notify()
+
+    def discard(self, cnx):
+        """ close {cnx} & remove it from the pool, e.g. when the server has gone away """
+        close_cnx(cnx)
+        self.forget()
+
+    def forget(self):
+        with self.lock:
+            self.num_open -= 1
+            self.lock.notify()
+
+    def reap_idle(self):
+        """ close connections idle for more than `idle_timeout`, but keep `min_size` open """
+        too_old = time.time() - self.conf["idle_timeout"]
+        keep = []
+        for item in self.idle:
+            if item[1] < too_old and self.num_open > self.conf["min_size"]:
+                close_cnx(item[0])
+                self.num_open -= 1
+            else:
+                keep.append(item)
+        self.idle = keep
+
+    def close_all(self):
+        with self.lock:
+            for item in self.idle:
+                close_cnx(item[0])
+            self.num_open -= len(self.idle)
+            self.idle = []
+
+
+class MariaDB:
+    def __init__(self, is_replica=False):
         self.which_connector = None
         self.credentials = None
-        self.tcp_cnx = None
+        self.pool = None
+        self.is_replica = is_replica
+        self.replica = None
+        self.replica_window = REPLICA_DEFAULTS["window"]
+        self.replica_failed_at = 0
+        self.this_thread = threading.local()
+        self.stats = {"pings": 0, "pings_skipped": 0, "reconnects": 0, "replica_selects": 0}
+        self.stats_lock = threading.Lock()
         self.schema = None
+        self.cache = None
+        self.native_dates = False
         self.logins = fileloader.FileLoader(static.LOGINS_FILE)
 
+    @property
+    def tcp_cnx(self):
+        """ the connection for this thread, checked out of the pool on first use """
+        if getattr(self.this_thread, "cnx", None) is None and self.pool is not None:
+            self.this_thread.cnx, self.this_thread.used_at = self.pool.checkout()
+        return getattr(self.this_thread, "cnx", None)
+
+    def release(self):
+        """ return this thread's connection to the pool, e.g. at the end of a web request """
+        if (cnx := getattr(self.this_thread, "cnx", None)) is not None and self.pool is not None:
+            self.pool.checkin(cnx, self.this_thread.used_at)
+        self.this_thread.cnx = None
+        self.this_thread.wrote_at = 0
+        if self.replica is not None:
+            self.replica.release()
+
+    def detach(self):
+        """ take this thread's connections away from it, so `release` leaves them alone, e.g. while a result is
+            still being streamed after the web request has ended, give them back with `checkin_detached` """
+        held = []
+        for db in [self, self.replica]:
+            if db is not None and db.pool is not None and (cnx := getattr(db.this_thread, "cnx", None)) is not None:
+                held.append([db.pool, cnx, db.this_thread.used_at])
+                db.this_thread.cnx = None
+        return held
+
+    def checkin_detached(self, held):
+        for pool, cnx, used_at in held:
+            pool.checkin(cnx, used_at)
+
+    def count(self, item):
+        """ add one to counter {item}, many threads share this connection manager """
+        with self.stats_lock:
+            self.stats[item] += 1
+
+    def counters(self):
+        """ connection counters, with the replica's & table cache's, for `sqlstats` """
+        with self.stats_lock:
+            ret = dict(self.stats)
+        if self.replica is not None:
+            ret["replica"] = self.replica.counters()
+        if self.cache is not None:
+            ret["table_cache"] = self.cache.counters()
+        return ret
+
+    def check_alive(self):
+        """ only ping the server if this connection has not been used for `ping_interval` secs
+            if it has died since, we will get a 2006/2013 & reconnect in `sql_run` """
+        if time.time() - self.this_thread.used_at < self.pool.conf["ping_interval"]:
+            self.count("pings_skipped")
+            return
+        self.count("pings")
+        try:
+            self.tcp_cnx.ping()
+        except Exception:
+            self.reconnect()
+
     def close(self):
-        self.tcp_cnx.close()
+        self.release()
+        if self.pool is not None:
+            self.pool.close_all()
+        if self.replica is not None:
+            self.replica.close()
 
     def reconnect(self):
+        if (cnx := getattr(self.this_thread, "cnx", None)) is not None and self.pool is not None:
+            self.pool.discard(cnx)
+        self.this_thread.cnx = None
+        self.count("reconnects")
+        if self.in_transaction():
+            self.this_thread.txn_lost = True
+        return self.actually_connect()
+
+    def in_transaction(self):
+        return getattr(self.this_thread, "txn_depth", 0) > 0
+
+    def transaction_lost(self):
+        """ the connection was lost part way through a transaction, so its work is gone """
+        return self.in_transaction() and self.this_thread.txn_lost
+
+    def transaction_committed(self):
+        """ did the last outermost `transaction` block commit, as one that failed does not raise an exception """
+        return getattr(self.this_thread, "txn_committed", False)
+
+    def fail_transaction(self):
+        """ mark the innermost `transaction` block to be rolled back, when it ends """
+        if self.in_transaction():
+            self.this_thread.txn_failed[-1] = True
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """ run all the SQL in the `with` block as one transaction, committed at the end of the outermost block
+            rolled back if an exception is raised or any SQL failed, nested blocks use a savepoint """
+        depth = getattr(self.this_thread, "txn_depth", 0)
+        if depth == 0:
+            self.this_thread.txn_failed = []
+            self.this_thread.txn_lost = False
+            self.this_thread.txn_tables = set()
+        self.this_thread.txn_failed.append(False)
+        self.this_thread.txn_depth = depth + 1
+        self.sql_exec("start transaction" if depth == 0 else f"savepoint txn_{depth}")
         try:
-            self.close()
+            yield
         except Exception:
-            pass
-        return self.actually_connect()
+            self.fail_transaction()
+            raise
+        finally:
+            failed = self.this_thread.txn_failed.pop()
+            if depth > 0:
+                self.sql_exec(f"rollback to savepoint txn_{depth}" if failed else f"release savepoint txn_{depth}")
+            self.this_thread.txn_depth = depth
+            if depth == 0:
+                self.end_transaction(failed)
+
+    def end_transaction(self, failed):
+        self.this_thread.txn_committed = False
+        if self.this_thread.txn_lost:
+            log("Transaction lost as connection to database failed")
+            return
+        try:
+            if failed:
+                self.tcp_cnx.rollback()
+            else:
+                self.tcp_cnx.commit()
+                self.this_thread.txn_committed = True
+        except Exception as exc:
+            log(f"Transaction {'rollback' if failed else 'commit'} failed: {exc}")
+        if not failed:
+            for table in self.this_thread.txn_tables:
+                self.cache.invalidate(table)
 
     def return_select(self):
         res = self.tcp_cnx.store_result()
         db_rows = res.fetch_row(maxrows=0, how=1)
         return True, list(db_rows)
 
-    def sql_run(self, sql, func):
-        """ run the {sql}, reconnecting to MySQL, if necessary """
-        log_sql(sql)
+    def sql_run(self, sql, func, params=None):
+        """ run the {sql}, with `PARAM`s filled from {params}, reconnecting to MySQL, if necessary """
         if self.tcp_cnx is None:
             print(f"Database is not connected '{sql}'")
             log(f"Database is not connected '{sql}'")
             return None, None
 
-        sql_server.tcp_cnx.ping(True)
+        self.check_alive()
+        if self.transaction_lost():
+            return False, "Transaction lost as connection to database failed"
+        template = sql
+        started = time.perf_counter()
         try:
+            sql = fill_params(self.tcp_cnx, sql, params)
+            log_sql(sql)
             self.tcp_cnx.query(sql)
-            return func()
+            ret = func()
+            self.this_thread.used_at = time.time()
+            return self.query_done(template, started, ret)
 
         except Exception as exc:
             this_exc = exc
-            if exc.args[0] == 2006:
-                self.reconnect()
+            if exc.args[0] in SERVER_HAS_GONE and self.reconnect() and not self.transaction_lost():
                 try:
                     self.tcp_cnx.query(sql)
-                    return func()
+                    ret = func()
+                    self.this_thread.used_at = time.time()
+                    return self.query_done(template, started, ret)
                 except Exception as exc:
                     this_exc = exc
+            self.fail_transaction()
             log(f"SQL: {sql}")
             log("SQL-ERROR:" + str(this_exc))
             print("SQL-ERROR:" + str(this_exc))
-            return False, this_exc.args[1]
-
-    def run_select(self, sql):
-        return self.sql_run(sql, self.return_select)
+            return self.query_done(template, started,
+                                   (False, this_exc.args[1] if len(this_exc.args) > 1 else str(this_exc)))
+
+    def query_done(self, template, started, ret):
+        """ record the time the SQL took, keyed by its {template}, for `sqlstats` """
+        sql_stats.record(template, time.perf_counter() - started, rows_of_result(ret), ret[0] is False)
+        return ret
+
+    def use_replica(self, sql):
+        """ send selects to the replica, unless this thread has written something in the last `window` secs
+            or in this web request (read-your-writes), is in a transaction, or the replica recently failed """
+        if self.replica is None or self.in_transaction():
+            return False
+        now = time.time()
+        if now - self.replica_failed_at < REPLICA_RETRY:
+            return False
+        if now - getattr(self.this_thread, "wrote_at", 0) < self.replica_window:
+            return False
+        return sql.lstrip()[:6].lower() == "select"
+
+    def replica_failed(self):
+        log(f"Replica select failed, using primary for the next {REPLICA_RETRY} secs")
+        self.replica_failed_at = time.time()
+
+    def run_select(self, sql, params=None):
+        if self.use_replica(sql):
+            ok, reply = self.replica.run_select(sql, params)
+            if ok:
+                self.count("replica_selects")
+                return ok, reply
+            self.replica_failed()
+        return self.sql_run(sql, self.return_select, params)
+
+    def return_use_result(self):
+        return True, self.tcp_cnx.use_result()
+
+    def run_select_iter(self, sql, params=None, batch_size=SELECT_BATCH_ROWS):
+        """ run select {sql} without loading all the rows into memory, returns a generator of lists of rows
+            this thread's connection can not be used for anything else until the generator is finished """
+        if self.use_replica(sql):
+            ok, batches = self.replica.run_select_iter(sql, params, batch_size)
+            if ok:
+                self.count("replica_selects")
+                return ok, batches
+            self.replica_failed()
+        ok, res = self.sql_run(sql, self.return_use_result, params)
+        if not ok:
+            return ok, res
+        return True, fetch_batches(res, batch_size)
 
     def return_exec(self):
         lastrowid = self.tcp_cnx.insert_id()
         affected_rows = self.tcp_cnx.affected_rows()
         self.tcp_cnx.store_result()
-        self.tcp_cnx.commit()
+        if not self.in_transaction():
+            self.tcp_cnx.commit()
+        self.this_thread.wrote_at = time.time()
         return affected_rows, lastrowid
 
     def get_cols(self, table):
@@ -266,17 +798,39 @@ class MariaDB:
         return None
 
     def sql_close(self):
-        self.tcp_cnx.close()
+        self.close()
+
+    def sql_exec(self, sql, params=None):
+        ret = self.sql_run(sql, self.return_exec, params)
+        if ret[0] is not None and ret[0] is not False:
+            self.written(table_written(sql))
+        return ret
+
+    def written(self, table):
+        """ change the generation of {table} after it was written, or after the commit when in a transaction,
+            changing it before lets another process cache the old rows under the new generation """
+        if table is None or (table not in self.table_cache().tables and table not in WATCHED_TABLES):
+            return
+        if self.in_transaction():
+            self.this_thread.txn_tables.add(table)
+        else:
+            self.cache.invalidate(table)
 
-    def sql_exec(self, sql):
-        return self.sql_run(sql, self.return_exec)
+    def table_changed(self, table):
+        """ tell all processes {table} has changed, for changes not made with `sql_exec`, e.g. `alter table` """
+        self.table_cache().invalidate(table)
+
+    def table_generation(self, table):
+        return self.table_cache().generation(table)
 
     def sql_delete(self, table, where):
-        ok, __ = self.sql_exec(f"delete from {table} where {data_set(where, ' and ')}")
+        where_clause, params = data_set(where, " and ")
+        ok, __ = self.sql_exec(f"delete from {table} where {where_clause}", params)
         return ok is not None
 
     def sql_delete_one(self, table, where):
-        ok, __ = self.sql_exec(f"delete from {table} where {data_set(where, ' and ')} limit 1")
+        where_clause, params = data_set(where, " and ")
+        ok, __ = self.sql_exec(f"delete from {table} where {where_clause} limit 1", params)
         return ok is not None
 
     def sql_insert(self, table, column_vals, ignore=False):
@@ -284,12 +838,63 @@ class MariaDB:
             for col in [c for c in static.NOW_DATE_FIELDS if c in cols and c not in column_vals]:
                 column_vals[col] = None
         with_ignore = "ignore" if ignore else ""
-        return self.sql_exec(f"insert {with_ignore} into {table} set " + data_set(column_vals, ",", is_set=True))
+        set_clause, params = data_set(column_vals, ",", is_set=True)
+        return self.sql_exec(f"insert {with_ignore} into {table} set {set_clause}", params)
+
+    def sql_insert_many(self, table, rows, ignore=False):
+        """ insert list of dicts {rows} into {table}, using as few multi-row inserts as we can
+            rows with the same columns, in any order, share inserts, if one fails its rows are tried one by one
+            returns if all worked, list of [affected_rows, first row_id] for each insert run
+            & the rows that were not inserted, all of them if in a transaction, as it will be rolled back """
+        cols = self.get_cols(table)
+        by_columns = {}
+        for row in rows:
+            this_row = dict(row)
+            if cols is not None:
+                for col in [c for c in static.NOW_DATE_FIELDS if c in cols and c not in this_row]:
+                    this_row[col] = None
+            these_rows, originals = by_columns.setdefault(tuple(sorted(this_row)), ([], []))
+            these_rows.append(this_row)
+            originals.append(row)
+
+        failed = []
+        chunks = []
+        with_ignore = "ignore" if ignore else ""
+        for columns, (these_rows, originals) in by_columns.items():
+            start_sql = f"insert {with_ignore} into {table} ({','.join(columns)}) values "
+            done = 0
+            for sql, params, num_rows in chunk_rows(start_sql, columns, these_rows):
+                affected_rows, row_id = self.sql_exec(sql, params)
+                chunks.append([affected_rows, row_id])
+                if affected_rows is None or affected_rows is False:
+                    if num_rows > 1 and not self.in_transaction():
+                        failed.extend(
+                            self.insert_one_by_one(start_sql, columns, these_rows[done:done + num_rows],
+                                                   originals[done:done + num_rows], chunks))
+                    else:
+                        failed.extend(originals[done:done + num_rows])
+                done += num_rows
+
+        if failed and self.in_transaction():
+            failed = list(rows)
+        return len(failed) == 0, chunks, failed
+
+    def insert_one_by_one(self, start_sql, columns, rows, originals, chunks):
+        """ insert {rows} of a multi-row insert that failed one at a time, so one bad row does not lose the rest
+            returns the {originals} of those that still failed """
+        failed = []
+        for row, original in zip(rows, originals):
+            row_values, params = values_of_row(columns, row)
+            affected_rows, row_id = self.sql_exec(start_sql + row_values, params)
+            chunks.append([affected_rows, row_id])
+            if affected_rows is None or affected_rows is False:
+                failed.append(original)
+        return failed
 
     def sql_exists(self, table, where):
-        sql = f"select 1 from {table} where " + data_set(where, " and ") + " limit 1"
-        ret, __ = self.run_select(sql)
-        return (ret is not None) and (self.tcp_cnx.affected_rows() > 0)
+        where_clause, params = data_set(where, " and ")
+        ok, reply = self.run_select(f"select 1 from {table} where {where_clause} limit 1", params)
+        return bool(ok) and len(reply) > 0
 
     def sql_update_one(self, table, column_vals, where):
         if (cols := self.get_cols(table)) is not None and "amended_dt" in cols and isinstance(column_vals, dict):
@@ -297,17 +902,18 @@ class MariaDB:
         return self.sql_update(table, column_vals, where, 1)
 
     def sql_update(self, table, column_vals, where, limit=None):
-        update_cols = data_set(column_vals, ",", is_set=True)
-        where_clause = data_set(where, " and ")
+        update_cols, params = data_set(column_vals, ",", is_set=True)
+        where_clause, where_params = data_set(where, " and ")
         sql = f"update {table} set {update_cols} where {where_clause}"
         if limit is not None:
             sql += f" limit {limit}"
-        ok, __ = self.sql_exec(sql)
+        ok, __ = self.sql_exec(sql, params + where_params)
         return ok is not None
 
-    def sql_select(self, table, where, columns="*", limit=None, order_by=None):
+    def sql_select(self, table, where, columns="*", limit=None, order_by=None, cached=False):
+        """ select from {table}, with {cached} the rows may come from `TableCache`, if {table} can be cached """
         sql = f"select {columns} from {table} "
-        where_clause = data_set(where, " and ")
+        where_clause, params = data_set(where, " and ")
         if where_clause is not None:
             sql += "where " + where_clause
 
@@ -316,10 +922,30 @@ class MariaDB:
         if limit is not None:
             sql += f" limit {limit}"
 
-        return self.run_select(sql)
-
-    def sql_select_one(self, table, where, columns="*"):
-        if (reply := self.sql_select(table, where, columns, 1))[0] and len(reply[1]) > 0:
+        if cached and not self.in_transaction():
+            return self.cached_select(table, sql, params)
+        return self.run_select(sql, params)
+
+    def table_cache(self):
+        if self.cache is None:
+            self.cache = TableCache()
+        return self.cache
+
+    def cached_select(self, table, sql, params):
+        if table not in self.table_cache().tables:
+            return self.run_select(sql, params)
+
+        key = (table, sql, tuple(params))
+        rows, gen = self.cache.get(table, key)
+        if rows is not None:
+            return True, rows
+        ok, reply = self.run_select(sql, params)
+        if ok:
+            self.cache.put(key, gen, reply)
+        return ok, reply
+
+    def sql_select_one(self, table, where, columns="*", cached=False):
+        if (reply := self.sql_select(table, where, columns, 1, cached=cached))[0] and len(reply[1]) > 0:
             return True, reply[1][0]
         return False, reply[1]
 
@@ -346,6 +972,8 @@ class MariaDB:
 
         self.credentials = {cred: None for cred in ALL_CREDENTIALS}
         self.credentials["server"] = mysql_json["connect"]
+        if self.is_replica and (conf := replica_config(mysql_json)) is not None:
+            self.credentials["server"] = conf["server"]
 
         if isinstance(mysql_json[self.which_connector], str):
             self.credentials["username"] = self.which_connector
@@ -365,20 +993,60 @@ class MariaDB:
 
         return True
 
-    def connect(self, login=None):
-        """ Connect to MySQL based on ENV vars """
-        if login:
+    def get_pool_config(self):
+        """ pool sizes are optional, set per login in `mysql.pool.<login>` or `pdns.pool` """
+        logins_data = self.logins.data()
+        if self.which_connector == "pdns":
+            return logins_data["pdns"].get("pool")
+        if "pool" in logins_data["mysql"] and isinstance(logins_data["mysql"]["pool"], dict):
+            return logins_data["mysql"]["pool"].get(self.which_connector)
+        return None
+
+    def connect(self, login=None, native_dates=None):
+        """ Connect to MySQL based on ENV vars, with {native_dates} DATETIME columns are `datetime`, not `str` """
+        if login and login != self.which_connector:
+            self.close()
+            self.pool = None
             self.which_connector = login
+        if native_dates is not None and native_dates != self.native_dates:
+            self.close()
+            self.pool = None
+            self.native_dates = native_dates
         if self.which_connector is None:
             raise ValueError("Reconnect, but no initial login set")
-        return self.actually_connect()
+        ok = self.actually_connect()
+        self.connect_replica()
+        return ok
 
-    def actually_connect(self):
+    def connect_replica(self):
+        """ open the read-only replica, if one is configured for this login, see `use_replica` """
+        if self.is_replica or self.which_connector == "pdns":
+            return
+        conf = replica_config(self.logins.data()["mysql"])
+        if conf is None or self.which_connector not in conf["logins"]:
+            if self.replica is not None:
+                self.replica.close()
+                self.replica = None
+            return
+        self.replica_window = conf["window"]
+        if self.replica is None:
+            self.replica = MariaDB(is_replica=True)
+        if not self.replica.connect(self.which_connector, self.native_dates):
+            self.replica_failed()
 
+    def actually_connect(self):
+        """ (re)load the credentials & make sure this thread has a connection """
         ok = self.get_pdns_login() if self.which_connector == "pdns" else self.get_mysql_login()
         if not ok:
             raise ValueError(f"ERROR: Could not find credentials for user {self.which_connector}")
 
+        if self.pool is None:
+            self.pool = ConnectionPool(self.open_connection, self.get_pool_config())
+
+        return self.tcp_cnx is not None
+
+    def open_connection(self):
+        """ open a new connection using the current credentials """
         host = port = None
         sock = ""
 
@@ -393,51 +1061,54 @@ class MariaDB:
                 port = int(svr[1])
 
         try:
-            new_cnx = _mysql.connect(user=self.credentials["username"],
-                                     password=self.credentials["password"],
-                                     unix_socket=sock,
-                                     host=host,
-                                     port=port,
-                                     database=self.credentials["database"],
-                                     conv=my_conv,
-                                     charset='utf8mb4',
-                                     init_command='set names utf8mb4')
-            self.tcp_cnx = new_cnx
+            return _mysql.connect(user=self.credentials["username"],
+                                  password=self.credentials["password"],
+                                  unix_socket=sock,
+                                  host=host,
+                                  port=port,
+                                  database=self.credentials["database"],
+                                  conv=native_dates_conv if self.native_dates else my_conv,
+                                  charset='utf8mb4',
+                                  init_command='set names utf8mb4')
         except Exception as exc:
             log("Failed to connet to MySQL: " + str(exc))
-            self.tcp_cnx = None
 
-        return self.tcp_cnx is not None
+        return None
+
+    def schema_checksum(self):
+        """ checksum of all tables, columns & indexes, so we can tell if our snapshot is out of date """
+        ok, reply = self.run_select(SCHEMA_CHECKSUM_SQL)
+        if not ok or len(reply) != 1:
+            return None
+        return ":".join([str(reply[0][item]) for item in ["num_cols", "cols", "num_idxs", "idxs"]])
 
-    def add_indexes_to_schema(self, new_schema, table):
-        """ Add index info for {table} to {new_schema} """
-        ok, reply = self.run_select("show index from " + table)
+    def introspect_schema(self):
+        """ load all tables, columns & indexes from `information_schema` """
+        ok, reply = self.run_select(SCHEMA_COLUMNS_SQL)
         if not ok:
-            raise ValueError(f"Could not get indexes for '{table}'")
+            raise ValueError("Could not load columns from information_schema")
+        schema = {}
+        for col in reply:
+            col["Default"] = unquote_default(col["Default"])
+            if col["table_name"] not in schema:
+                schema[col["table_name"]] = {"columns": {}, "indexes": {}}
+            schema[col["table_name"]]["columns"][col["Field"]] = schema_of_col(schema, col)
 
-        new_schema[table]["indexes"] = {}
+        ok, reply = self.run_select(SCHEMA_INDEXES_SQL)
+        if not ok:
+            raise ValueError("Could not load indexes from information_schema")
         for col in reply:
-            key = col["Key_name"] if col["Key_name"] != "PRIMARY" else ":primary:"
-            if key not in new_schema[table]["indexes"]:
-                new_schema[table]["indexes"][key] = {}
-                new_schema[table]["indexes"][key]["columns"] = []
-            new_schema[table]["indexes"][key]["columns"].append(col["Column_name"])
-            new_schema[table]["indexes"][key]["unique"] = col["Non_unique"] == 0
+            if col["table_name"] in schema:
+                add_index_to_schema(schema[col["table_name"]]["indexes"], col)
+
+        return schema
 
     def make_schema(self):
-        schema = {}
-        ok, ret = self.run_select("show tables")
-        this_db = "Tables_in_" + self.credentials["database"]
-        schema = {table[this_db]: {} for table in ret}
-        for table in schema:
-            this_tbl = schema[table]
-            ok, ret = self.run_select("describe " + table)
-            this_tbl["columns"] = {}
-            cols = list(ret)
-            cols.sort(key=sort_elm)
-            for col in cols:
-                schema[table]["columns"][col["Field"]] = schema_of_col(schema, col)
-            self.add_indexes_to_schema(schema, table)
+        database = self.credentials["database"]
+        checksum = self.schema_checksum()
+        if (schema := load_schema_snapshot(database, checksum)) is None:
+            schema = self.introspect_schema()
+            save_schema_snapshot(database, checksum, schema)
 
         load_more_schema(schema)
         if ":more:" in schema and "joins" in schema[":more:"]:
@@ -449,6 +1120,125 @@ class MariaDB:
 sql_server = MariaDB()
 
 
+class EventWriter:
+    """ queue rows for the `events` table & insert them in batches from a background thread, so callers don't wait
+        batches are written every `event_flush_ms` or `event_batch_size` events, to a file if the insert fails """
+    def __init__(self, db):
+        self.db = db
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.stats = {"queued": 0, "written": 0, "to_file": 0, "queue_full": 0}
+
+    def start(self):
+        """ start the writer thread, or restart it in a forked child, which does not inherit threads """
+        with self.lock:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.queue = queue.Queue(maxsize=policy.policy("event_queue_size"))
+            self.thread = threading.Thread(target=self.run, name="event-writer", daemon=True)
+            self.thread.start()
+
+    def add(self, event_db):
+        if event_db.get("when_dt") is None:
+            event_db["when_dt"] = misc.now()
+        self.start()
+        try:
+            self.queue.put_nowait(event_db)
+            self.count("queued")
+        except queue.Full:
+            self.count("queue_full")
+            self.write([event_db])
+
+    def count(self, item, num=1):
+        with self.lock:
+            self.stats[item] += num
+
+    def counters(self):
+        with self.lock:
+            return dict(self.stats, waiting=self.queue.qsize() if self.queue is not None else 0)
+
+    def next_batch(self, flush_secs, batch_size):
+        """ wait for an event, then collect more for up to {flush_secs}, returns the batch & if we should stop """
+        if (event_db := self.queue.get()) is None:
+            return [], True
+        batch = [event_db]
+        give_up_at = time.time() + flush_secs
+        while len(batch) < batch_size and (time_left := give_up_at - time.time()) > 0:
+            try:
+                if (event_db := self.queue.get(timeout=time_left)) is None:
+                    return batch, True
+            except queue.Empty:
+                break
+            batch.append(event_db)
+        return batch, False
+
+    def run(self):
+        flush_secs = policy.policy("event_flush_ms") / 1000
+        batch_size = policy.policy("event_batch_size")
+        stop = False
+        while not stop:
+            batch, stop = self.next_batch(flush_secs, batch_size)
+            if batch:
+                self.write(batch)
+                self.db.release()
+
+    def write(self, batch):
+        try:
+            __, __, failed = self.db.sql_insert_many("events", batch)
+        except Exception as exc:
+            log(f"Failed to insert events: {exc}")
+            failed = batch
+        self.count("written", len(batch) - len(failed))
+        if failed:
+            self.write_file(failed)
+
+    def write_file(self, batch):
+        """ the database insert failed, so append the events to today's file, so they are not lost """
+        lines = []
+        for event_db in batch:
+            try:
+                lines.append(json.dumps(event_db, default=misc.json_default) + "\n")
+            except (TypeError, ValueError) as exc:
+                log(f"Failed to save event to file: {exc} - {event_db}")
+        try:
+            if not os.path.isdir(EVENTS_DIR):
+                os.makedirs(EVENTS_DIR, mode=0o777, exist_ok=True)
+            filename = os.path.join(misc.make_year_month_day_dir(EVENTS_DIR), "events.jsonl")
+            with open(filename, "a", encoding="utf-8") as fd:
+                fd.write("".join(lines))
+            self.count("to_file", len(lines))
+        except IOError as exc:
+            log(f"Failed to save {len(lines)} events to file: {exc}")
+
+    def flush(self):
+        """ write all queued events & stop the thread, e.g. when the process exits """
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid():
+                return
+            thread = self.thread
+            self.thread = None
+        try:
+            self.queue.put(None, timeout=EVENTS_STOP_WAIT)
+            thread.join(EVENTS_STOP_WAIT)
+        except queue.Full:
+            pass
+        batch = []
+        while not self.queue.empty():
+            if (event_db := self.queue.get_nowait()) is not None:
+                batch.append(event_db)
+        if batch:
+            self.write(batch)
+
+
+event_writer = EventWriter(sql_server)
+atexit.register(event_writer.flush)
+sql_stats.add_counters("mysql", sql_server.counters)
+sql_stats.add_counters("events", event_writer.counters)
+
+
 def main():
     log_init(with_debug=True)
     sql_server.connect("admin")
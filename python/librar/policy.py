@@ -6,7 +6,7 @@
 import json
 
 from librar import static
-from librar import fileloader
+from librar import snapshot
 
 policy_defaults = {
     "smtp_tls_security_level": "may",
@@ -30,6 +30,24 @@ policy_defaults = {
     "session_timeout": 60,
     "webui_sessions": 5,
     "admin_sessions": 3,
+    "webui_threads": 1,
+    "admin_threads": 1,
+    "slow_query_secs": 1,
+    "sql_stats_dump_secs": 60,
+    "sql_cache_tables": ["zones", "class_by_name", "class_by_regexp"],
+    "sql_cache_ttl": 60,
+    "sql_cache_size": 1000,
+    "zones_recheck_secs": 60,
+    "class_recheck_secs": 60,
+    "idn_cache_size": 10000,
+    "event_flush_ms": 250,
+    "event_batch_size": 100,
+    "event_queue_size": 5000,
+    "log_sink": "syslog",
+    "log_queue_size": 10000,
+    "log_batch_size": 200,
+    "log_jsonl_max_size": 10485760,
+    "log_jsonl_keep": 5,
     "currency": static.DEFAULT_CURRENCY,
     "log_epp_api": True,
     "business_name": "Registry",
@@ -58,27 +76,17 @@ policy_defaults = {
 
 
 class Policy:
-    """ policy values manager """
+    """ policy values manager, `policy.json` merged with `policy_defaults` comes from the shared config snapshot """
     def __init__(self):
-        self.file = fileloader.FileLoader(static.POLICY_FILE)
-        self.all_data = None
-        self.merge_policy_data()
-
-    def merge_policy_data(self):
-        self.all_data = policy_defaults.copy()
-        self.all_data.update(self.file.data())
-
-    def check_file(self):
-        if self.file.check_for_new():
-            self.merge_policy_data()
+        self.snapshot = snapshot.ConfigSnapshot(policy_defaults)
+        self.snapshot.current()
 
     def policy(self, name, default_value=None):
-        self.check_file()
-        return self.all_data[name] if name in self.all_data else default_value
+        all_data = self.snapshot.current()["policy"]
+        return all_data[name] if name in all_data else default_value
 
     def data(self):
-        self.check_file()
-        return self.all_data
+        return self.snapshot.current()["policy"]
 
 
 this_policy = Policy()
@@ -8,17 +8,14 @@ import json
 import random
 import requests
 import copy
+import threading
 
 from librar import misc, fileloader, static
 from librar.mysql import sql_server as sql
-from librar.log import init as log_init
+from librar.log import log, init as log_init
 from librar.policy import this_policy as policy
 
 SEND_REGS_ITEMS = ["max_checks", "desc", "type", "locks", "renew_limit"]
-MANDATORY_REGS_ITEMS = [
-    "max_checks", "locks", "renew_limit", "expire_recover_limit", "strict_idna2008", "domain_transfer_age",
-    "new_order_remind_cancel", "renew_order_remind_cancel"
-]
 
 DEFAULT_XMLNS = {
     "contact": "urn:ietf:params:xml:ns:contact-1.0",
@@ -71,97 +68,125 @@ def get_price_from_json(price_json, cls, action):
     return None
 
 
+def compile_price_factor(factor):
+    """ price {factor} from the config, `x1.5`, `+2` or a fixed price, as `(multiply, add)`
+        applied to the registry's price, with `multiply` = None for a fixed price of `add` """
+    if factor is None:
+        return None
+    try:
+        if isinstance(factor, str) and factor[:1] == "x":
+            return float(factor[1:]), 0
+        if isinstance(factor, str) and factor[:1] == "+":
+            return 1, float(factor[1:])
+        return None, float(factor)
+    except ValueError:
+        log(f"ERROR: Invalid price factor '{factor}'")
+        return None
+
+
 class ZoneLib:
     def __init__(self):
         self.zone_list = []
         self.zone_data = {}
         self.zone_priority = {}
+        self.price_factors = {}
         self.zones_from_db = []
+        self.db_zones = {}
         self.registry = None
         self.clients = {}
-        self.policy_mtime = fileloader.have_newer(None, static.POLICY_FILE)
+        self.snapshot_version = None
+        self.lock = threading.Lock()
 
         self.last_zone_table = None
+        self.zones_count = None
+        self.zones_generation = None
+        self.zones_checked_at = 0
         self.check_zone_table()
         self.logins_file = fileloader.FileLoader(static.LOGINS_FILE)
-        self.regs_file = fileloader.FileLoader(static.REGISTRY_FILE)
-        self.priority_file = fileloader.FileLoader(static.PRIORITY_FILE)
 
         self.process_json()
 
     def check_zone_table(self):
-        ok, last_change = sql.sql_select_one("zones", "enabled and allow_sales", "max(amended_dt) 'last_change'")
+        """ only query `zones` when a write has changed its generation, or every `zones_recheck_secs`
+            to see changes made directly in the database """
+        generation = sql.table_generation("zones")
+        if (self.last_zone_table is not None and generation == self.zones_generation
+                and time.time() - self.zones_checked_at < policy.policy("zones_recheck_secs")):
+            return False
+
+        # not cached, the cache could hide a change made directly in the database for `sql_cache_ttl`
+        ok, last_change = sql.sql_select_one("zones", "enabled and allow_sales",
+                                             "max(amended_dt) 'last_change',count(*) 'num_zones'")
         if not ok:
             return None
 
-        if self.last_zone_table is not None and self.last_zone_table >= last_change["last_change"]:
+        self.zones_generation = generation
+        self.zones_checked_at = time.time()
+
+        if (self.last_zone_table is not None and self.last_zone_table >= last_change["last_change"]
+                and self.zones_count == last_change["num_zones"]):
             return False
 
-        self.last_zone_table = last_change["last_change"]
-        ok, self.zones_from_db = sql.sql_select("zones", "enabled and allow_sales")
+        ok, zones_from_db = sql.sql_select("zones", "enabled and allow_sales")
         if not ok:
             return None
+        self.last_zone_table = last_change["last_change"]
+        self.zones_count = last_change["num_zones"]
 
-        self.zone_data = {}
-        for row in self.zones_from_db:
-            self.zone_data[row["zone"]] = {col: row[col] for col in ["registry", "renew_limit"] if row[col]}
+        db_zones = {}
+        for row in zones_from_db:
+            db_zones[row["zone"]] = {col: row[col] for col in ["registry", "renew_limit"] if row[col]}
             if misc.has_data(row, "price_info"):
                 try:
-                    self.zone_data[row["zone"]]["prices"] = json.loads(row["price_info"])
+                    db_zones[row["zone"]]["prices"] = json.loads(row["price_info"])
                 except ValueError:
                     pass
+        self.zones_from_db, self.db_zones = zones_from_db, db_zones
         return True
 
     def check_for_new_files(self):
-        new_policy_mtime = fileloader.have_newer(self.policy_mtime, static.POLICY_FILE)
-        zones_db_is_new = self.check_zone_table()
-        regs_file_is_new = self.regs_file.check()
-        priority_file_is_new = self.priority_file.check()
-
-        if regs_file_is_new or priority_file_is_new or zones_db_is_new or new_policy_mtime is not None:
-            self.policy_mtime = new_policy_mtime
-            self.process_json()
-            return True
+        """ reload if the zones or config changed, other threads keep using the old data until the new is swapped in
+            if another thread is already reloading, we do not wait for it """
+        if not self.lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return False
+        try:
+            zones_db_is_new = self.check_zone_table()
+            if zones_db_is_new or policy.snapshot.version() != self.snapshot_version:
+                self.process_json()
+                return True
+        finally:
+            self.lock.release()
 
         return False
 
     def process_json(self):
-        with open(static.PORTS_LIST_FILE, "r", encoding="UTF-8") as fd:
-            port_lines = [line.split() for line in fd.readlines()]
-        ports = {p[0]: int(p[1]) for p in port_lines}
-
-        self.zone_priority = {idx: pos for pos, idx in enumerate(self.priority_file.json)}
-
-        self.registry = copy.deepcopy(self.regs_file.json)
-        for registry, reg_data in self.registry.items():
-            for param in MANDATORY_REGS_ITEMS:
-                if param not in reg_data:
-                    reg_data[param] = policy.policy(param)
-
-            reg_data["name"] = registry
-            if reg_data["type"] == "epp" and registry in ports:
-                reg_data["url"] = f"http://127.0.0.1:{ports[registry]}/epp/api/v1.0/request"
-
-        for __, zone_rec in self.zone_data.items():
-            zone_rec["reg_data"] = self.registry[zone_rec["registry"]]
+        """ build the new zone data in locals, then swap it in, so other threads never see it half done """
+        config = policy.snapshot.current()
+        registry = copy.deepcopy(config["registry"])
+
+        zone_data = {}
+        for zone, db_zone in self.db_zones.items():
+            zone_rec = zone_data[zone] = dict(db_zone)
+            zone_rec["reg_data"] = registry[zone_rec["registry"]]
             if "renew_limit" not in zone_rec or not zone_rec["renew_limit"]:
                 zone_rec["renew_limit"] = zone_rec["reg_data"]["renew_limit"]
 
-        new_list = [{"name": dom, "priority": self.tld_priority(dom, is_tld=True)} for dom in self.zone_data]
+        self.zone_priority = config["zone_priority"]
+        new_list = [{"name": dom, "priority": self.tld_priority(dom, is_tld=True)} for dom in zone_data]
         self.sort_data_list(new_list, is_tld=True)
-        self.zone_list = [dom["name"] for dom in new_list]
 
-        is_epp = {}
-        for name, reg_data in self.registry.items():
+        clients = {}
+        for name, reg_data in registry.items():
             if reg_data["type"] == "epp":
-                is_epp[name] = True
-                if name not in self.clients:
-                    self.clients[name] = requests.Session()
+                clients[name] = self.clients[name] if name in self.clients else requests.Session()
+        old_clients = self.clients
 
-        for reg in list(self.clients):
-            if reg not in is_epp:
-                self.clients[reg].close()
-                del self.clients[reg]
+        self.zone_data, self.registry, self.zone_list, self.clients, self.price_factors, self.snapshot_version = (
+            zone_data, registry, [dom["name"] for dom in new_list], clients, {}, config["version"])
+
+        for reg, client in old_clients.items():
+            if reg not in clients:
+                client.close()
 
     def regs_send(self):
         regs_to_send = {}
@@ -186,6 +211,13 @@ class ZoneLib:
             return None
         return self.zone_data[tld]
 
+    def zone_of_domain(self, name):
+        """ zone {name} can be registered in, i.e. it is one label in front of the zone, or None
+            a name that is one of our zones, e.g. `co.uk` when we also sell `uk`, can not be registered """
+        if (idx := name.find(".")) < 0 or name in self.zone_data:
+            return None
+        return zone if (zone := name[idx + 1:]) in self.zone_data else None
+
     def tld_of_name(self, name):
         if (idx := name.find(".")) >= 0:
             return name[idx + 1:]
@@ -205,7 +237,7 @@ class ZoneLib:
         return self.registry[registry]["url"]
 
     def reg_record_for_domain(self, domain):
-        if (tld := self.tld_of_name(domain)) is None or tld not in self.zone_data:
+        if (tld := self.zone_of_domain(domain)) is None or tld not in self.zone_data:
             return None
         return self.zone_data[tld]["reg_data"] if "reg_data" in self.zone_data[tld] else None
 
@@ -240,11 +272,19 @@ class ZoneLib:
             return ret
         return None
 
+    def price_factor(self, tld, cls, action):
+        """ compiled price factor for {action} on class {cls} in zone {tld}, worked out once per config change """
+        key = (tld, cls, action)
+        if key not in self.price_factors:
+            self.price_factors[key] = compile_price_factor(
+                self.get_mulitple(self.zone_data[tld]["reg_data"], tld, cls, action))
+        return self.price_factors[key]
+
     def multiply_values(self, check_dom_data, num_years, retain_reg_price=False):
+        currency = policy.policy("currency")
         for dom in check_dom_data:
-            if (tld := self.tld_of_name(dom["name"])) is None:
+            if (tld := self.tld_of_name(dom["name"])) is None or tld not in self.zone_data:
                 return False
-            this_reg = self.zone_data[tld]["reg_data"]
 
             cls = dom["class"].lower() if "class" in dom else "standard"
 
@@ -252,32 +292,26 @@ class ZoneLib:
                 if action not in dom:
                     continue
 
-                if ((factor := self.get_mulitple(this_reg, tld, cls, action)) is None
-                        and action in ["transfer", "restore"] and (dom[action] is None or dom[action] == 0)):
-                    factor = self.get_mulitple(this_reg, tld, cls, "renew")
+                if ((factor := self.price_factor(tld, cls, action)) is None and action in ["transfer", "restore"]
+                        and (dom[action] is None or dom[action] == 0)):
+                    factor = self.price_factor(tld, cls, "renew")
 
                 if factor is None:
                     del dom[action]
                 else:
-                    apply_price_factor(action, dom, factor, num_years, retain_reg_price)
+                    apply_price_factor(action, dom, factor, num_years, retain_reg_price, currency)
 
         return True
 
 
-def apply_price_factor(action, dom, factor, num_years, retain_reg_price):
+def apply_price_factor(action, dom, factor, num_years, retain_reg_price, currency):
     regs_price = float(dom[action]) if dom[action] is not None else 0
-    if isinstance(factor, str):
-        if factor[:1] == "x":
-            our_price = regs_price * float(factor[1:])
-        elif factor[:1] == "+":
-            our_price = regs_price + float(factor[1:])
-    else:
-        our_price = float(factor)
+    multiply, add = factor
+    our_price = add if multiply is None else regs_price * multiply + add
 
     if dom[action] is None or dom[action] == 0:
         our_price *= float(num_years)
 
-    currency = policy.policy("currency")
     if retain_reg_price:
         dom["reg_" + action] = misc.amt_from_float(regs_price, currency)
     dom[action] = misc.amt_from_float(our_price, currency)
@@ -0,0 +1,148 @@
+#! /usr/bin/python3
+# (c) Copyright 2019-2023, James Stevens ... see LICENSE for details
+# Alternative license arrangements possible, contact me for more information
+""" compile the config files into one versioned snapshot, built once & shared by every process """
+
+import os
+import json
+import fcntl
+import hashlib
+import syslog
+import tempfile
+
+from librar import static, filewatch
+from librar.fileloader import load_file_json
+
+SNAPSHOT_DIR = f"{os.environ['BASE']}/storage/shared/config"
+SNAPSHOT_FILE = f"{SNAPSHOT_DIR}/snapshot.json"
+LOCK_FILE = f"{SNAPSHOT_DIR}/snapshot.lock"
+
+SOURCE_FILES = [static.POLICY_FILE, static.REGISTRY_FILE, static.PRIORITY_FILE, static.PORTS_LIST_FILE]
+
+
+def source_stamps(policy_defaults):
+    """ mtime, size & inode of each source file & a hash of the defaults, the snapshot is current while these match """
+    stamps = {}
+    for file in SOURCE_FILES:
+        stamps[file] = list(stamp) if (stamp := filewatch.file_stamp(file)) is not None else None
+    defaults = json.dumps([policy_defaults, static.MANDATORY_REGS_ITEMS], sort_keys=True)
+    stamps[":defaults:"] = hashlib.sha256(defaults.encode()).hexdigest()
+    return stamps
+
+
+def load_ports():
+    if not os.path.isfile(static.PORTS_LIST_FILE):
+        return {}
+    with open(static.PORTS_LIST_FILE, "r", encoding="UTF-8") as fd:
+        port_lines = [line.split() for line in fd.readlines()]
+    return {p[0]: int(p[1]) for p in port_lines if len(p) >= 2}
+
+
+def compile_snapshot(policy_defaults, previous):
+    """ merge & precompute the config, items that fail to load are kept from {previous} """
+    sources = source_stamps(policy_defaults)
+    policy_json = load_file_json(static.POLICY_FILE)
+    regs_json = load_file_json(static.REGISTRY_FILE)
+    priority_json = load_file_json(static.PRIORITY_FILE)
+
+    if policy_json is None:
+        if previous is not None:
+            return None
+        policy_json = {}
+    all_policy = policy_defaults.copy()
+    all_policy.update(policy_json)
+
+    if regs_json is None or priority_json is None:
+        if previous is not None:
+            return None
+        regs_json = regs_json or {}
+        priority_json = priority_json or []
+
+    ports = load_ports()
+    registry = {}
+    for name, this_reg in regs_json.items():
+        reg_data = registry[name] = dict(this_reg)
+        for param in static.MANDATORY_REGS_ITEMS:
+            if param not in reg_data:
+                reg_data[param] = all_policy.get(param)
+        reg_data["name"] = name
+        if reg_data["type"] == "epp" and name in ports:
+            reg_data["url"] = f"http://127.0.0.1:{ports[name]}/epp/api/v1.0/request"
+
+    zone_priority = {idx: pos for pos, idx in enumerate(priority_json)}
+    return {
+        "version": (previous["version"] if previous is not None else 0) + 1,
+        "sources": sources,
+        "policy": all_policy,
+        "registry": registry,
+        "zone_priority": zone_priority
+    }
+
+
+def read_snapshot():
+    try:
+        with open(SNAPSHOT_FILE, "r", encoding="UTF-8") as fd:
+            return json.load(fd)
+    except (ValueError, IOError):
+        return None
+
+
+def save_snapshot(data):
+    """ write to a temp file, then rename it, so readers always see a whole snapshot """
+    with tempfile.NamedTemporaryFile("w", encoding="UTF-8", dir=SNAPSHOT_DIR, delete=False) as fd:
+        json.dump(data, fd)
+    os.chmod(fd.name, 0o644)
+    os.replace(fd.name, SNAPSHOT_FILE)
+
+
+class ConfigSnapshot:
+    """ the compiled config, the first process to see a change builds the new snapshot, the rest load it """
+    def __init__(self, policy_defaults):
+        self.policy_defaults = policy_defaults
+        self.generations = None
+        self.data = None
+
+    def current(self):
+        """ latest snapshot, a generation compare per source file until one of them changes """
+        if (generations := [filewatch.generation(file) for file in SOURCE_FILES]) != self.generations:
+            self.attach()
+            self.generations = generations
+        return self.data
+
+    def version(self):
+        return self.current()["version"]
+
+    def attach(self):
+        try:
+            if not os.path.isdir(SNAPSHOT_DIR):
+                os.makedirs(SNAPSHOT_DIR, mode=0o777, exist_ok=True)
+            lock_fd = os.open(LOCK_FILE, os.O_RDONLY | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+                self.attach_locked()
+            finally:
+                os.close(lock_fd)
+        except OSError as exc:
+            syslog.syslog(syslog.LOG_ERR, f"Config snapshot in '{SNAPSHOT_DIR}' failed: {exc}")
+            if (data := compile_snapshot(self.policy_defaults, self.data)) is not None:
+                self.data = data
+
+    def attach_locked(self):
+        shared = read_snapshot()
+        if shared is not None and shared["sources"] == source_stamps(self.policy_defaults):
+            if self.data is None or shared["version"] != self.data["version"]:
+                self.data = shared
+            return
+
+        previous = self.data if shared is None or self.data is not None else shared
+        if (data := compile_snapshot(self.policy_defaults, previous)) is None:
+            syslog.syslog(syslog.LOG_ERR, "Config snapshot not rebuilt, a config file failed to load")
+            if self.data is None:
+                self.data = shared
+            return
+
+        if shared is not None and shared["version"] >= data["version"]:
+            data["version"] = shared["version"] + 1
+        save_snapshot(data)
+        self.data = data
+        syslog.syslog(syslog.LOG_NOTICE, f"Config snapshot version {data['version']} saved")
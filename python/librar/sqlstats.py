@@ -0,0 +1,198 @@
+#! /usr/bin/python3
+# (c) Copyright 2019-2023, James Stevens ... see LICENSE for details
+# Alternative license arrangements possible, contact me for more information
+""" count how often each shape of SQL statement is run & how long it takes, logging slow queries """
+
+import os
+import re
+import json
+import time
+import bisect
+import atexit
+import tempfile
+import functools
+import threading
+
+from librar.log import log
+from librar.callers import daemon_name
+from librar.policy import this_policy as policy
+
+STATS_DIR = f"{os.environ['BASE']}/storage/shared/sql_stats"
+
+HIST_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+HIST_NAMES = [f"<{ms}ms" for ms in HIST_BOUNDS_MS] + [f">={HIST_BOUNDS_MS[-1]}ms"]
+
+LITERALS = [
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), "?"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "?"),
+    (re.compile(r"\b[0-9]+(?:\.[0-9]+)?\b"), "?"),
+    (re.compile("\x00"), "?"),
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"\(\?(?: ?, ?\?)+\)"), "(...)"),
+    (re.compile(r"\(\.\.\.\)(?: ?, ?\(\.\.\.\))+"), "(...)"),
+]
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """ {sql} with all literal values taken out, so every run of the same statement has the same key """
+    for regexp, replace in LITERALS:
+        sql = regexp.sub(replace, sql)
+    return sql.strip()
+
+
+def new_hist():
+    return [0] * len(HIST_NAMES)
+
+
+class SqlStats:
+    """ latency, row & error counts per statement fingerprint, saved to `STATS_DIR` every `sql_stats_dump_secs` """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.counters = {}
+        self.daemon = None
+        self.dumped_at = time.time()
+        self.slow_secs = None
+        self.dump_secs = None
+        self.load_policy()
+
+    def load_policy(self):
+        self.slow_secs = policy.policy("slow_query_secs")
+        self.dump_secs = policy.policy("sql_stats_dump_secs")
+
+    def record(self, sql, secs, rows, failed):
+        """ add one run of {sql} (before its params were filled in) taking {secs} """
+        key = fingerprint(sql)
+        bucket = bisect.bisect_right(HIST_BOUNDS_MS, secs * 1000)
+        with self.lock:
+            if (this_stat := self.stats.get(key)) is None:
+                this_stat = self.stats[key] = {
+                    "count": 0,
+                    "errors": 0,
+                    "rows": 0,
+                    "total_secs": 0,
+                    "max_secs": 0,
+                    "hist": new_hist(),
+                    "recent": new_hist()
+                }
+            this_stat["count"] += 1
+            this_stat["rows"] += rows
+            this_stat["total_secs"] += secs
+            this_stat["hist"][bucket] += 1
+            this_stat["recent"][bucket] += 1
+            if failed:
+                this_stat["errors"] += 1
+            if secs > this_stat["max_secs"]:
+                this_stat["max_secs"] = secs
+
+        if self.slow_secs is not None and secs >= self.slow_secs:
+            log(f"SLOW-SQL {secs:.3f}s rows={rows}: {key[:500]}")
+
+        if time.time() - self.dumped_at >= self.dump_secs:
+            self.start_dump()
+
+    def start_dump(self):
+        """ save the stats in a thread, so the request that happens to be running is not held up """
+        with self.lock:
+            if time.time() - self.dumped_at < self.dump_secs:
+                return
+            self.dumped_at = time.time()
+        threading.Thread(target=self.dump, name="sql-stats-dump", daemon=True).start()
+
+    def add_counters(self, name, func):
+        """ save what {func} returns, e.g. cache hits & misses, as {name} with the SQL stats """
+        self.counters[name] = func
+
+    def top(self, top_n=None, sort_by="total_secs"):
+        """ the {top_n} statements with the highest {sort_by} """
+        with self.lock:
+            rows = [dict(this_stat, sql=key) for key, this_stat in self.stats.items()]
+        rows.sort(key=lambda row: row[sort_by], reverse=True)
+        return rows[:top_n] if top_n else rows
+
+    def dump(self):
+        """ save the stats to `STATS_DIR` as `<daemon>.<pid>.json`, then start a new `recent` period """
+        self.dumped_at = time.time()
+        self.load_policy()
+        if self.daemon is None:
+            self.daemon = daemon_name()
+        counters = {name: func() for name, func in self.counters.items()}
+        report = {
+            "daemon": self.daemon,
+            "pid": os.getpid(),
+            "when": int(self.dumped_at),
+            "stats": self.top(),
+            "counters": counters
+        }
+        with self.lock:
+            for this_stat in self.stats.values():
+                this_stat["recent"] = new_hist()
+        try:
+            if not os.path.isdir(STATS_DIR):
+                os.makedirs(STATS_DIR, mode=0o777, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=STATS_DIR, delete=False) as fd:
+                json.dump(report, fd)
+            os.chmod(fd.name, 0o644)
+            os.replace(fd.name, os.path.join(STATS_DIR, f"{self.daemon}.{os.getpid()}.json"))
+        except IOError as exc:
+            log(f"Failed to save SQL stats: {exc}")
+
+
+sql_stats = SqlStats()
+
+
+@atexit.register
+def dump_at_exit():
+    if sql_stats.stats:
+        sql_stats.dump()
+
+
+def load_reports(daemon=None):
+    """ all the saved reports, or just those for {daemon} """
+    reports = []
+    if not os.path.isdir(STATS_DIR):
+        return reports
+    for file in os.listdir(STATS_DIR):
+        if file[-5:] != ".json" or (daemon is not None and file.split(".")[0] != daemon):
+            continue
+        try:
+            with open(os.path.join(STATS_DIR, file), "r", encoding="utf-8") as fd:
+                reports.append(json.load(fd))
+        except (ValueError, IOError):
+            continue
+    return reports
+
+
+def merge_reports(reports):
+    """ add up the stats for each daemon from all its processes """
+    merged = {}
+    for report in reports:
+        this_daemon = merged.setdefault(report["daemon"], {})
+        for row in report["stats"]:
+            if (this_stat := this_daemon.get(row["sql"])) is None:
+                this_daemon[row["sql"]] = dict(row)
+                continue
+            for item in ["count", "errors", "rows", "total_secs"]:
+                this_stat[item] += row[item]
+            this_stat["max_secs"] = max(this_stat["max_secs"], row["max_secs"])
+            for item in ["hist", "recent"]:
+                this_stat[item] = [a + b for a, b in zip(this_stat[item], row[item])]
+    return merged
+
+
+def add_up_counters(total, counters):
+    """ add the numbers in nested dict {counters} to {total} """
+    for item, value in counters.items():
+        if isinstance(value, dict):
+            add_up_counters(total.setdefault(item, {}), value)
+        elif isinstance(value, (int, float)):
+            total[item] = total.get(item, 0) + value
+
+
+def merge_counters(reports):
+    """ add up the counters for each daemon from all its processes """
+    merged = {}
+    for report in reports:
+        add_up_counters(merged.setdefault(report["daemon"], {}), report.get("counters", {}))
+    return merged
@@ -17,6 +17,11 @@ DEFAULT_NS = "ns1.example.com,ns2.exmaple.com"
 
 HEADER = {'Content-type': 'application/json', 'Accept': 'application/json'}
 
+MANDATORY_REGS_ITEMS = [
+    "max_checks", "locks", "renew_limit", "expire_recover_limit", "strict_idna2008", "domain_transfer_age",
+    "new_order_remind_cancel", "renew_order_remind_cancel"
+]
+
 CLIENT_DOM_FLAGS = ["DeleteProhibited", "RenewProhibited", "TransferProhibited", "UpdateProhibited"]
 DOMAIN_ACTIONS = ["create", "renew", "transfer", "restore"]
 
@@ -7,9 +7,11 @@ import binascii
 import base64
 import sys
 import re
+import functools
 
 from librar import registry, misc, static, log
 from librar.mysql import sql_server as sql
+from librar.sqlstats import sql_stats
 from librar.policy import this_policy as policy
 
 IS_HOST = r'^(\*\.|)([\_a-z0-9]([-a-z-0-9]{0,61}[a-z0-9]){0,1}\.)+[a-z0-9]([-a-z0-9]{0,61}[a-z0-9]){0,1}[.]?$'
@@ -139,6 +141,13 @@ def is_valid_tld(name):
 def is_valid_fqdn(name, strict_idna_2008=None):
     if name is None or not isinstance(name, str):
         return False
+    if strict_idna_2008 is None:
+        strict_idna_2008 = policy.policy("strict_idna2008")
+    return cached_valid_fqdn(name, bool(strict_idna_2008))
+
+
+@functools.lru_cache(maxsize=misc.IDN_CACHE_SIZE)
+def cached_valid_fqdn(name, strict_idna_2008):
     if len(name) > 255 or len(name) <= 0:
         return False
     if re.match(IS_FQDN, name, re.IGNORECASE) is None:
@@ -148,6 +157,14 @@ def is_valid_fqdn(name, strict_idna_2008=None):
     return True
 
 
+def cache_stats():
+    """ hits & misses of the FQDN validation & IDN decoding caches """
+    return {"fqdn": cached_valid_fqdn.cache_info()._asdict(), "idn": misc.cached_puny_to_utf8.cache_info()._asdict()}
+
+
+sql_stats.add_counters("idn_caches", cache_stats)
+
+
 def is_valid_hostname(name):
     if name is None or not isinstance(name, str):
         return False
@@ -179,7 +179,7 @@ if __name__ == "__main__":
     args = parser.parse_args()
     log_init(with_debug=args.debug)
 
-    sql.connect("engine")
+    sql.connect("engine", native_dates=True)
     registry.start_up()
 
     if args.server:
@@ -60,7 +60,7 @@ def load_records(which_message, request_list):
                 reply[fmt + "_fmt"] = misc.format_currency(reply[fmt], my_currency)
 
         if table == "users":
-            reply["hash_confirm"] = hashstr.make_hash(reply["created_dt"] + ":" + reply["email"])
+            reply["hash_confirm"] = hashstr.make_hash(misc.date_str(reply["created_dt"]) + ":" + reply["email"])
 
         tag = request[3] if len(request) == 3 else table.rstrip("s")
 
@@ -92,7 +92,7 @@ def spool(which_message, request_list):
 
     with tempfile.NamedTemporaryFile("w+", encoding="utf-8", dir=SPOOL_BASE, delete=False,
                                      prefix=which_message + "_") as fd:
-        fd.write(json.dumps(request_data))
+        fd.write(json.dumps(request_data, default=misc.json_default))
 
     event_log("Queued", request_data)
     return True
@@ -15,7 +15,6 @@ from mailer import spool_email
 from payments import payfuncs
 
 from payments import pay_handler
-from payments.plugins import *
 
 HAS_RUN_START_UP = False
 
@@ -23,7 +22,7 @@ HAS_RUN_START_UP = False
 def startup():
     global HAS_RUN_START_UP
     pay_conf = payfuncs.payment_file.data()
-    for module in [mod for mod in pay_conf if mod in pay_handler.pay_plugins]:
+    for module in [mod for mod in pay_conf if pay_handler.plugin(mod) is not None]:
         if (func := pay_handler.run(module, "startup")) is not None and func():
             this_conf = pay_conf[module]
             my_mode = this_conf["mode"] if "mode" in this_conf else "live"
@@ -40,7 +39,7 @@ def config():
         startup()
 
     all_config = {}
-    for module in [mod for mod in payfuncs.payment_file.data() if mod in pay_handler.pay_plugins]:
+    for module in [mod for mod in payfuncs.payment_file.data() if pay_handler.plugin(mod) is not None]:
         all_config[module] = None
         if (func := pay_handler.run(module, "config")) is not None:
             all_config[module] = func()
@@ -3,7 +3,10 @@
 # Alternative license arrangements possible, contact me for more information
 """ handles plug-in modules for domain interfaces needed by the UI """
 
+import importlib
+
 from payments import payfuncs
+from payments import plugins
 
 pay_plugins = {}
 pay_webhooks = {}
@@ -15,14 +18,21 @@ def add_plugin(name, funcs):
     pay_plugins[name] = funcs
 
 
+def plugin(name):
+    """ handlers for plugin {name}, its module is only imported the first time it is needed """
+    if name not in pay_plugins and name in plugins.__all__:
+        importlib.import_module(f"{plugins.__name__}.{name}")
+    return pay_plugins.get(name)
+
+
 def run(plugin_name, func_name):
     """ return the function named {func_name} in the set of handlers for {plugin_name} """
-    if plugin_name not in pay_plugins or func_name not in pay_plugins[plugin_name]:
-        return None
     pay_conf = payfuncs.payment_file.data()
     if plugin_name not in pay_conf:
         return None
-    return pay_plugins[plugin_name][func_name]
+    if (funcs := plugin(plugin_name)) is None or func_name not in funcs:
+        return None
+    return funcs[func_name]
 
 
 def module_config(this_module):
@@ -0,0 +1,46 @@
+#! /usr/bin/python3
+# (c) Copyright 2019-2023, James Stevens ... see LICENSE for details
+# Alternative license arrangements possible, contact me for more information
+""" zone lookups must agree with splitting off the first label, run with `BASE` set, as for the daemons """
+
+from librar import registry
+
+ZONES = ["uk", "co.uk", "zz", "of.glass"]
+NAMES = [
+    "a.uk", "a.co.uk", "co.uk", "uk", "b.a.co.uk", "a.b.uk", "www.example.com", "example.com", "x.yy", "zz", "xx",
+    "a.zz", "b.of.glass", "of.glass", "glass", "a.b.of.glass", "www.a.zz"
+]
+
+
+def make_zone_lib():
+    zone_lib = registry.ZoneLib.__new__(registry.ZoneLib)
+    zone_lib.zone_data = {zone: {"reg_data": {"name": "test"}} for zone in ZONES}
+    return zone_lib
+
+
+def first_label_tld(zone_lib, name):
+    """ `tld_of_name` before the zone trie """
+    if (idx := name.find(".")) >= 0:
+        return name[idx + 1:]
+    return name if name in zone_lib.zone_data else None
+
+
+def test_tld_of_name():
+    zone_lib = make_zone_lib()
+    for name in NAMES:
+        assert zone_lib.tld_of_name(name) == first_label_tld(zone_lib, name), name
+
+
+def test_supported_tld():
+    zone_lib = make_zone_lib()
+    for name in NAMES:
+        assert zone_lib.supported_tld(name) == (first_label_tld(zone_lib, name) in zone_lib.zone_data), name
+    assert not zone_lib.supported_tld("")
+    assert not zone_lib.supported_tld(None)
+
+
+def test_zone_of_domain():
+    zone_lib = make_zone_lib()
+    for name in NAMES:
+        zone = first_label_tld(zone_lib, name) if name.find(".") >= 0 and name not in zone_lib.zone_data else None
+        assert zone_lib.zone_of_domain(name) == (zone if zone in zone_lib.zone_data else None), name
@@ -124,6 +124,8 @@ def live_process_basket(req, whole_basket):
     for order in basket:
         if "failed" not in order and pay_for_basket_item(req, order, user_db) is None:
             order["failed"] = "Paying for item failed"
+    if any("paid-for" in order for order in basket):
+        backend_creator.signal_backend()
 
 
 def pay_for_basket_item(req, order, user_db):
@@ -134,6 +136,25 @@ def pay_for_basket_item(req, order, user_db):
     if (user_db["acct_current_balance"] - user_db["acct_overdraw_limit"]) < order_db["price_paid"]:
         return False
 
+    with sql.transaction():
+        if not charge_for_basket_item(req, order, user_db) or not backend_creator.insert_job(
+                order_db["order_type"], order_db, order_db["num_years"], order_db["authcode"]):
+            sql.fail_transaction()
+            return False
+
+    if not sql.transaction_committed():
+        return False
+
+    user_db["acct_previous_balance"] = user_db["acct_current_balance"]
+    user_db["acct_current_balance"] -= order_db["price_paid"]
+
+    order["paid-for"] = True
+    return True
+
+
+def charge_for_basket_item(req, order, user_db):
+    """ debit the account & record the sale, all of which must be done, or none of it """
+    order_db = order["order_db"]
     ok, trans_id = accounts.apply_transaction(
         user_db["user_id"], (-1 * order_db["price_paid"]),
         f"{order_db['order_type']} on {order['domain']} for {order_db['num_years']} yrs")
@@ -141,9 +162,6 @@ def pay_for_basket_item(req, order, user_db):
     if not ok or not trans_id:
         return False
 
-    user_db["acct_previous_balance"] = user_db["acct_current_balance"]
-    user_db["acct_current_balance"] -= order_db["price_paid"]
-
     if order_db['order_type'] == "dom/transfer":
         ok, dom_db = make_blank_domain(order['domain'], user_db, static.STATUS_TRANS_QUEUED, order_db["num_years"])
         if not ok:
@@ -162,8 +180,6 @@ def pay_for_basket_item(req, order, user_db):
         sql.sql_update("transactions", {"sales_item_id": sold_id}, {"transaction_id": trans_id})
 
     event_log(req, order)
-    order["paid-for"] = True
-    backend_creator.make_job(order_db["order_type"], order_db, order_db["num_years"], order_db["authcode"])
     return True
 
 
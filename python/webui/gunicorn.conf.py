@@ -0,0 +1,10 @@
+#! /usr/bin/python3
+# (c) Copyright 2019-2023, James Stevens ... see LICENSE for details
+# Alternative license arrangements possible, contact me for more information
+""" gunicorn hooks, the app is preloaded in the master, then each worker opens its own DB & HTTP sessions """
+
+from webui import run_webui
+
+
+def post_fork(__, ___):
+    run_webui.start_worker()
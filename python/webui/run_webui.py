@@ -3,12 +3,14 @@
 # Alternative license arrangements possible, contact me for more information
 """ module to run the rest/api for user's site web/ui """
 
-import inspect
+import os
+import threading
 import flask
 import validators
 
-from librar import registry, validate, passwd, pdns, common_ui, static, misc, domobj
-from librar.log import log, debug, init as log_init
+from librar import registry, validate, passwd, pdns, common_ui, static, misc, domobj, mysql
+from librar.log import log, debug, start_context, end_context, request_id, init as log_init
+from librar.callers import caller
 from librar.policy import this_policy as policy
 from librar.mysql import sql_server as sql
 from mailer import spool_email
@@ -34,16 +36,34 @@ REMOVE_TO_SECURE = {
 }
 
 log_init("logging_webui")
-sql.connect("webui")
 application = flask.Flask("EPP Registrar")
-registry.start_up()
-pdns.start_up()
-libpay.startup()
 
 site_currency = policy.policy("currency")
 if not validate.valid_currency(site_currency):
     raise ValueError("ERROR: Main policy.currency is not set up correctly")
 
+WORKER_PID = None
+worker_lock = threading.Lock()
+
+
+@application.before_request
+def start_worker():
+    """ open the DB & HTTP sessions in this process, after any fork, so `gunicorn --preload` never shares them
+        the gunicorn `post_fork` hook runs this, so a worker is ready before its first request
+        the DB connection used is given back to the pool, as the thread running `post_fork` serves no requests """
+    global WORKER_PID
+    if WORKER_PID == os.getpid():
+        return
+    with worker_lock:
+        if WORKER_PID == os.getpid():
+            return
+        sql.connect("webui")
+        registry.start_up()
+        pdns.start_up()
+        libpay.startup()
+        sql.release()
+        WORKER_PID = os.getpid()
+
 
 class WebuiReq:
     """ data unique to each request to keep different users data separate """
@@ -109,7 +129,7 @@ class WebuiReq:
 
     def event(self, data):
         """ log an event """
-        context = inspect.stack()[1]
+        context = caller()
         data["program"] = context.filename.split("/")[-1]
         data["function"] = context.function
         data["line_num"] = context.lineno
@@ -117,7 +137,12 @@ class WebuiReq:
         for item, evt_data in self.base_event.items():
             if item not in data:
                 data[item] = evt_data
-        sql.sql_insert("events", data)
+        mysql.event_writer.add(data)
+
+
+@application.before_request
+def start_log_context():
+    start_context(request=request_id(flask.request.headers.get("X-Request-ID")))
 
 
 @application.before_request
@@ -140,6 +165,12 @@ def before_request():
     return flask.make_response(flask.jsonify({"error": "Website continuity error"}), HTML_CODE_ERR)
 
 
+@application.teardown_request
+def teardown_request(__):
+    sql.release()
+    end_context()
+
+
 @application.route('/pyrar/v1.0/config', methods=['GET'])
 def get_config():
     req = WebuiReq()
@@ -306,7 +337,7 @@ def payments_delete():
     provider = req.post_js["provider"]
     if provider.find(":") > 0:
         provider = provider.split(":")[0]
-    if provider not in pay_handler.pay_plugins:
+    if pay_handler.plugin(provider) is None:
         return req.abort(f"Invalid payment provider '{req.post_js['provider']}'")
 
     pay_db = {
@@ -342,7 +373,7 @@ def payments_single():
 
     provider = req.post_js["provider"]
     pay_conf = payfuncs.payment_file.data()
-    if provider not in pay_conf or provider not in pay_handler.pay_plugins:
+    if provider not in pay_conf or pay_handler.plugin(provider) is None:
         return req.abort(f"Unsupported provider - {provider}")
 
     if (func := pay_handler.run(provider, "single")) is None:
@@ -850,7 +881,7 @@ def run_user_domain_task(domain_function, func_name):
     if not ok:
         return req.abort(reply)
 
-    context = inspect.stack()[1]
+    context = caller()
     notes = f"Domain {func_name}: {context.function}"
 
     if func_name == "Gift":